@@ -0,0 +1,53 @@
+"""Add canonical department pair to communication_rules
+
+Rules are undirected, so lookups used to OR over (dept_a_id, dept_b_id) and
+(dept_b_id, dept_a_id). This adds low_dept_id/high_dept_id, backfills them and
+indexes them together with rule_type and is_active.
+
+Revision ID: 0001_rule_dept_pair
+Revises:
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_rule_dept_pair"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("communication_rules", sa.Column("low_dept_id", sa.Integer(), nullable=True))
+    op.add_column("communication_rules", sa.Column("high_dept_id", sa.Integer(), nullable=True))
+
+    op.execute(
+        """
+        UPDATE communication_rules
+        SET low_dept_id = CASE WHEN dept_a_id <= dept_b_id THEN dept_a_id ELSE dept_b_id END,
+            high_dept_id = CASE WHEN dept_a_id <= dept_b_id THEN dept_b_id ELSE dept_a_id END
+        """
+    )
+
+    with op.batch_alter_table("communication_rules") as batch_op:
+        batch_op.alter_column("low_dept_id", existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column("high_dept_id", existing_type=sa.Integer(), nullable=False)
+
+    op.create_index(
+        "ix_communication_rules_dept_pair",
+        "communication_rules",
+        ["low_dept_id", "high_dept_id", "rule_type", "is_active"],
+        postgresql_include=["expiry_timestamp", "user_specific", "requester_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_communication_rules_dept_pair", table_name="communication_rules")
+    with op.batch_alter_table("communication_rules") as batch_op:
+        batch_op.drop_column("high_dept_id")
+        batch_op.drop_column("low_dept_id")
@@ -0,0 +1,30 @@
+"""Add (timestamp, id) keyset indexes to message_logs
+
+Revision ID: 0002_message_log_keyset_indexes
+Revises: 0001_rule_dept_pair
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_message_log_keyset_indexes"
+down_revision: Union[str, None] = "0001_rule_dept_pair"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_message_logs_sender_timestamp", "message_logs", ["sender_id", "timestamp", "id"])
+    op.create_index("ix_message_logs_receiver_timestamp", "message_logs", ["receiver_id", "timestamp", "id"])
+    op.create_index("ix_message_logs_timestamp", "message_logs", ["timestamp", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_message_logs_timestamp", table_name="message_logs")
+    op.drop_index("ix_message_logs_receiver_timestamp", table_name="message_logs")
+    op.drop_index("ix_message_logs_sender_timestamp", table_name="message_logs")
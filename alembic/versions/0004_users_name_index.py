@@ -0,0 +1,26 @@
+"""Index users.name for name-ordered user search pages
+
+Revision ID: 0004_users_name_index
+Revises: 0003_user_search_index
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_users_name_index"
+down_revision: Union[str, None] = "0003_user_search_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_name", "users", ["name"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_name", table_name="users")
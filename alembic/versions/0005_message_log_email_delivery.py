@@ -0,0 +1,33 @@
+"""Track email delivery on message_logs
+
+Revision ID: 0005_message_log_email_delivery
+Revises: 0004_users_name_index
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_message_log_email_delivery"
+down_revision: Union[str, None] = "0004_users_name_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("message_logs", sa.Column("email_status", sa.String(length=20), nullable=True))
+    op.add_column("message_logs", sa.Column("email_attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("message_logs", sa.Column("email_next_attempt_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("message_logs", sa.Column("email_error", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("message_logs") as batch_op:
+        batch_op.drop_column("email_error")
+        batch_op.drop_column("email_next_attempt_at")
+        batch_op.drop_column("email_attempts")
+        batch_op.drop_column("email_status")
@@ -0,0 +1,35 @@
+"""Index mailboxes by (owner, id) instead of (owner, timestamp, id)
+
+Mailbox pages are now ordered by id, like delta sync, so one index per
+mailbox serves both and message_logs keeps the same number of indexes.
+
+Revision ID: 0006_message_log_delta_sync
+Revises: 0005_message_log_email_delivery
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_message_log_delta_sync"
+down_revision: Union[str, None] = "0005_message_log_email_delivery"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_message_logs_sender_id", "message_logs", ["sender_id", "id"])
+    op.create_index("ix_message_logs_receiver_id", "message_logs", ["receiver_id", "id"])
+    op.drop_index("ix_message_logs_receiver_timestamp", table_name="message_logs")
+    op.drop_index("ix_message_logs_sender_timestamp", table_name="message_logs")
+
+
+def downgrade() -> None:
+    op.create_index("ix_message_logs_sender_timestamp", "message_logs", ["sender_id", "timestamp", "id"])
+    op.create_index("ix_message_logs_receiver_timestamp", "message_logs", ["receiver_id", "timestamp", "id"])
+    op.drop_index("ix_message_logs_receiver_id", table_name="message_logs")
+    op.drop_index("ix_message_logs_sender_id", table_name="message_logs")
@@ -0,0 +1,26 @@
+"""Index users.dept_id for the communicable-users filter
+
+Revision ID: 0007_users_dept_id_index
+Revises: 0006_message_log_delta_sync
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_users_dept_id_index"
+down_revision: Union[str, None] = "0006_message_log_delta_sync"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_dept_id", "users", ["dept_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_dept_id", table_name="users")
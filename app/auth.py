@@ -9,9 +9,15 @@ from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from app.database import get_db, settings
 from app import models, schemas
+from app.principal_cache import principal_cache, snapshot_user
+from app.password_hasher import password_hashing_pool
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
+
+# "purpose" claim of the short-lived tokens that may only open the inbox stream
+STREAM_TICKET_PURPOSE = "stream"
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -22,6 +28,16 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password run on the hashing pool so the event loop is not blocked."""
+    return await password_hashing_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash run on the hashing pool so the event loop is not blocked."""
+    return await password_hashing_pool.run(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -33,17 +49,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def create_stream_ticket(email: str) -> str:
+    """
+    A token that only opens the inbox stream, for EventSource clients that
+    have to put it in the URL, where proxies and access logs record it.
+    """
+    return create_access_token(
+        {"sub": email, "purpose": STREAM_TICKET_PURPOSE},
+        expires_delta=timedelta(seconds=settings.stream_ticket_expire_seconds)
+    )
+
+
 async def authenticate_user(db: AsyncSession, email: str, password: str):
     result = await db.execute(select(models.User).filter(models.User.email == email))
     user = result.scalar_one_or_none()
     if not user:
         return False
-    if not verify_password(password, str(user.password_hash)):
+    if not await verify_password_async(password, str(user.password_hash)):
         return False
     return user
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    return await get_user_from_token(token, db)
+
+
+async def get_user_from_token(token: str, db: AsyncSession, purpose: Optional[str] = None) -> models.User:
+    """
+    Resolve a bearer token to a user snapshot, raising 401 if it is invalid.
+    Tokens issued for a purpose (see create_stream_ticket) are only accepted
+    where that purpose is asked for, and access tokens only where none is.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -52,10 +88,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: str | None = payload.get("sub")
-        if email is None:
+        if email is None or payload.get("purpose") != purpose:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    cached_user = principal_cache.get(email)
+    if cached_user is not None:
+        return cached_user
     result = await db.execute(
         select(models.User)
         .filter(models.User.email == email)
@@ -64,6 +103,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     user = result.scalar_one_or_none()
     if user is None:
         raise credentials_exception
+    user = snapshot_user(user)
+    principal_cache.set(email, user)
     return user
 
 
@@ -71,14 +112,19 @@ def get_current_active_user(current_user: models.User = Depends(get_current_user
     return current_user
 
 
+def check_role(current_user: models.User, required_roles: list[str]) -> models.User:
+    """Raise 403 unless the user has one of required_roles."""
+    role_name = current_user.role.name.lower()
+    if role_name not in [r.lower() for r in required_roles]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Operation requires one of these roles: {', '.join(required_roles)}"
+        )
+    return current_user
+
+
 def require_role(required_roles: list[str]):
     def role_checker(current_user: models.User = Depends(get_current_active_user)):
-        role_name = current_user.role.name.lower()
-        if role_name not in [r.lower() for r in required_roles]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Operation requires one of these roles: {', '.join(required_roles)}"
-            )
-        return current_user
+        return check_role(current_user, required_roles)
     return role_checker
 
@@ -1,5 +1,9 @@
+import time
+from typing import Optional
+from sqlalchemy import event, exc
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, StaticPool
 from pydantic_settings import BaseSettings
 import os
 from dotenv import load_dotenv
@@ -12,6 +16,16 @@ class Settings(BaseSettings):
     algorithm: str = os.getenv("ALGORITHM", "HS256")
     access_token_expire_minutes: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
+    # Connection pool settings (asyncpg), read from DB_POOL_SIZE etc. and
+    # validated at load. Unset means "use the driver profile" in POOL_PROFILES;
+    # see engine_options()
+    db_pool_size: Optional[int] = None
+    db_max_overflow: Optional[int] = None
+    db_pool_timeout: Optional[float] = None
+    db_pool_recycle: Optional[int] = None
+    db_pool_pre_ping: Optional[bool] = None
+    db_statement_cache_size: Optional[int] = None  # asyncpg prepared statements per connection
+    
     # Email settings
     mail_username: str = os.getenv("MAIL_USERNAME", "")
     mail_password: str = os.getenv("MAIL_PASSWORD", "")
@@ -22,6 +36,60 @@ class Settings(BaseSettings):
     mail_starttls: bool = os.getenv("MAIL_STARTTLS", "True").lower() == "true"
     mail_ssl_tls: bool = os.getenv("MAIL_SSL_TLS", "False").lower() == "true"
     enable_email: bool = os.getenv("ENABLE_EMAIL", "False").lower() == "true"
+    mail_timeout_seconds: float = float(os.getenv("MAIL_TIMEOUT_SECONDS", "30"))
+
+    # Outbox dispatcher settings (delivery of message events to email, webhooks, ...)
+    outbox_batch_size: int = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+    outbox_poll_interval_seconds: float = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "10"))
+    outbox_max_attempts: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+    outbox_retry_base_seconds: float = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "30"))
+    outbox_retry_max_seconds: float = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "3600"))
+    # How long a claimed batch may take to deliver before another dispatcher may claim it again
+    outbox_lease_seconds: float = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+    # Webhook sink: message events are POSTed in batches when WEBHOOK_URL is set
+    webhook_url: str = os.getenv("WEBHOOK_URL", "")
+    webhook_secret: str = os.getenv("WEBHOOK_SECRET", "")
+    webhook_timeout_seconds: float = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+
+    # Messaging settings
+    max_broadcast_recipients: int = int(os.getenv("MAX_BROADCAST_RECIPIENTS", "500"))
+
+    # Audit settings: sessions the user activity reports may hold at once,
+    # shared by all concurrent reports. Keep it well below the pool size.
+    audit_activity_max_sessions: int = int(os.getenv("AUDIT_ACTIVITY_MAX_SESSIONS", "3"))
+
+    # Password hashing pool settings
+    password_hash_workers: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    password_hash_max_queue: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+    # Principal cache settings
+    principal_cache_size: int = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+    principal_cache_ttl_seconds: float = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+
+    # Permission graph settings. Rule writes through the API reach every worker at
+    # once (see app/permission_graph.py); this bounds how long changes made
+    # straight in the database go unnoticed
+    permission_graph_max_age_seconds: float = float(os.getenv("PERMISSION_GRAPH_MAX_AGE_SECONDS", "60"))
+
+    # Reference data response cache (departments, roles), see app/http_cache.py
+    reference_cache_max_age_seconds: float = float(os.getenv("REFERENCE_CACHE_MAX_AGE_SECONDS", "5"))
+    reference_cache_size: int = int(os.getenv("REFERENCE_CACHE_SIZE", "256"))
+
+    # Live inbox stream (see app/pubsub.py). PUBSUB_BACKEND=postgres shares events
+    # between workers with LISTEN/NOTIFY; memory only reaches this process.
+    pubsub_backend: str = os.getenv("PUBSUB_BACKEND", "memory")
+    inbox_stream_queue_size: int = int(os.getenv("INBOX_STREAM_QUEUE_SIZE", "100"))
+    inbox_stream_keepalive_seconds: float = float(os.getenv("INBOX_STREAM_KEEPALIVE_SECONDS", "15"))
+    inbox_stream_replay_limit: int = int(os.getenv("INBOX_STREAM_REPLAY_LIMIT", "100"))
+    # Lifetime of the single-purpose tickets EventSource clients put in the stream URL
+    stream_ticket_expire_seconds: int = int(os.getenv("STREAM_TICKET_EXPIRE_SECONDS", "60"))
+
+    # Query profiling (development aid, see app/query_profiler.py)
+    query_profiling_enabled: bool = os.getenv("QUERY_PROFILING_ENABLED", "False").lower() == "true"
+    query_profiling_repeat_threshold: int = int(os.getenv("QUERY_PROFILING_REPEAT_THRESHOLD", "10"))
+    query_profiling_slow_ms: float = float(os.getenv("QUERY_PROFILING_SLOW_MS", "100"))
+    query_profiling_slowest: int = int(os.getenv("QUERY_PROFILING_SLOWEST", "5"))
 
     @property
     def async_database_url(self):
@@ -34,14 +102,160 @@ class Settings(BaseSettings):
 
     class Config:
         env_file = ".env"
+        # .env is shared with the frontend build (VITE_*)
+        extra = "ignore"
 
 settings = Settings()
 
+# Per-driver pool defaults. asyncpg is sized so that 8 workers x
+# (pool_size + max_overflow) stays under PostgreSQL's default max_connections
+# of 100. SQLite connections are cheap to open and each aiosqlite connection
+# holds a thread, so SQLite opens one per checkout instead of pooling.
+POOL_PROFILES = {
+    "asyncpg": {
+        "poolclass": "queue",
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 10.0,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_cache_size": 256,
+    },
+    "aiosqlite": {
+        "poolclass": "null",
+    },
+}
+
+
+class PoolStats:
+    """Counters fed by pool events and InstrumentedQueuePool."""
+
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = 0
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long checkouts take and when overflow
+    connections open. Only uses the pool's public API (connect, overflow),
+    so it does not depend on SQLAlchemy internals.
+    """
+
+    def connect(self):
+        overflow_before = self.overflow()
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+            if self.overflow() > overflow_before and self.overflow() > 0:
+                pool_stats.overflow_events += 1
+
+
+def engine_options(url: str) -> dict:
+    """create_async_engine arguments for the configured driver, with Settings overrides applied."""
+    driver = "asyncpg" if "+asyncpg" in url else "aiosqlite" if "+aiosqlite" in url else None
+    if driver == "aiosqlite" and ":memory:" in url:
+        # Every connection to an in-memory database is a separate database
+        return {"poolclass": StaticPool}
+    profile = POOL_PROFILES.get(driver, {"poolclass": "queue"})
+    if profile["poolclass"] == "null":
+        return {"poolclass": NullPool}
+    
+    def setting(name: str, profile_key: str, default):
+        value = getattr(settings, name)
+        if value is None:
+            return profile.get(profile_key, default)
+        return value
+    
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": setting("db_pool_size", "pool_size", 5),
+        "max_overflow": setting("db_max_overflow", "max_overflow", 10),
+        "pool_timeout": setting("db_pool_timeout", "pool_timeout", 30.0),
+        "pool_recycle": setting("db_pool_recycle", "pool_recycle", -1),
+        "pool_pre_ping": setting("db_pool_pre_ping", "pool_pre_ping", False),
+    }
+    if driver == "asyncpg":
+        options["connect_args"] = {
+            "prepared_statement_cache_size": setting("db_statement_cache_size", "statement_cache_size", 100)
+        }
+    return options
+
+
+_engine_options = engine_options(settings.async_database_url)
 engine = create_async_engine(
     settings.async_database_url,
-    echo=False
+    echo=False,
+    **_engine_options
 )
 
+
+@event.listens_for(engine.sync_engine.pool, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.connects += 1
+
+
+@event.listens_for(engine.sync_engine.pool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.checkouts += 1
+
+
+@event.listens_for(engine.sync_engine.pool, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    pool_stats.checkins += 1
+
+
+@event.listens_for(engine.sync_engine.pool, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats.invalidations += 1
+
+
+def get_pool_status() -> dict:
+    """Current pool occupancy plus the counters collected since startup."""
+    pool = engine.sync_engine.pool
+    status = {
+        "pool_class": type(pool).__name__,
+        "connects": pool_stats.connects,
+        "checkouts": pool_stats.checkouts,
+        "checkins": pool_stats.checkins,
+        "checked_out": pool_stats.checkouts - pool_stats.checkins,
+        "invalidations": pool_stats.invalidations,
+        "overflow_events": pool_stats.overflow_events,
+        "timeouts": pool_stats.timeouts,
+        "wait_avg_ms": round(pool_stats.wait_total / pool_stats.waits * 1000, 3) if pool_stats.waits else 0.0,
+        "wait_max_ms": round(pool_stats.wait_max * 1000, 3),
+    }
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": _engine_options["max_overflow"],
+            "timeout": pool.timeout(),
+        })
+    return status
+
 AsyncSessionLocal = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -1,147 +1,122 @@
-# ============================================================================
-# EMAIL FUNCTIONALITY DISABLED - COMMENTED OUT FOR FUTURE UPDATES
-# ============================================================================
-# To re-enable email functionality:
-# 1. Uncomment all code in this file
-# 2. Uncomment email import in app/routers/messages.py
-# 3. Uncomment email sending code in app/routers/messages.py
-# 4. Set ENABLE_EMAIL=True in .env file
-# 5. Configure SMTP settings in .env file
-# ============================================================================
-
-# from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
-# from pydantic import EmailStr
-# from typing import List, Optional
-# import logging
-
-# logger = logging.getLogger(__name__)
-
-# # Email configuration will be initialized when needed
-# _fm: Optional[FastMail] = None
-
-
-# def get_email_service():
-#     """Get or create the FastMail instance."""
-#     global _fm
-#     if _fm is None:
-#         from app.database import settings
-#         conf = ConnectionConfig(
-#             MAIL_USERNAME=settings.mail_username,
-#             MAIL_PASSWORD=settings.mail_password,
-#             MAIL_FROM=settings.mail_from,
-#             MAIL_PORT=settings.mail_port,
-#             MAIL_SERVER=settings.mail_server,
-#             MAIL_FROM_NAME=settings.mail_from_name,
-#             MAIL_STARTTLS=settings.mail_starttls,
-#             MAIL_SSL_TLS=settings.mail_ssl_tls,
-#             USE_CREDENTIALS=True,
-#             VALIDATE_CERTS=True
-#         )
-#         _fm = FastMail(conf)
-#     return _fm
-
-
-# async def send_email(
-#     recipient_email: EmailStr,
-#     subject: str,
-#     body: str,
-#     sender_name: Optional[str] = None,
-#     sender_email: Optional[EmailStr] = None
-# ) -> bool:
-#     """
-#     Send an email to a recipient.
-#     
-#     Args:
-#         recipient_email: Email address of the recipient
-#         subject: Email subject
-#         body: Email body content
-#         sender_name: Name of the sender (optional)
-#         sender_email: Email of the sender (optional, uses default if not provided)
-#     
-#     Returns:
-#         bool: True if email sent successfully, False otherwise
-#     """
-#     try:
-#         from app.database import settings
-#         if not settings.enable_email:
-#             logger.warning("Email sending is disabled")
-#             return False
-#         
-#         fm = get_email_service()
-#         
-#         # Format the email body with sender information if provided
-#         if sender_name:
-#             formatted_body = f"From: {sender_name}"
-#             if sender_email:
-#                 formatted_body += f" ({sender_email})"
-#             formatted_body += f"\n\n{body}"
-#         else:
-#             formatted_body = body
-#         
-#         message = MessageSchema(
-#             subject=subject or "PrivateRoute Message",
-#             recipients=[recipient_email],
-#             body=formatted_body,
-#             subtype="plain"
-#         )
-#         
-#         await fm.send_message(message)
-#         logger.info(f"Email sent successfully to {recipient_email}")
-#         return True
-#     except Exception as e:
-#         logger.error(f"Failed to send email to {recipient_email}: {str(e)}")
-#         return False
-
-
-# async def send_html_email(
-#     recipient_email: EmailStr,
-#     subject: str,
-#     html_body: str,
-#     sender_name: Optional[str] = None,
-#     sender_email: Optional[EmailStr] = None
-# ) -> bool:
-#     """
-#     Send an HTML email to a recipient.
-#     
-#     Args:
-#         recipient_email: Email address of the recipient
-#         subject: Email subject
-#         html_body: HTML email body content
-#         sender_name: Name of the sender (optional)
-#         sender_email: Email of the sender (optional)
-#     
-#     Returns:
-#         bool: True if email sent successfully, False otherwise
-#     """
-#     try:
-#         from app.database import settings
-#         if not settings.enable_email:
-#             logger.warning("Email sending is disabled")
-#             return False
-#         
-#         fm = get_email_service()
-#         
-#         # Format the HTML body with sender information if provided
-#         if sender_name:
-#             sender_info = f"<p><strong>From:</strong> {sender_name}"
-#             if sender_email:
-#                 sender_info += f" ({sender_email})"
-#             sender_info += "</p>"
-#             formatted_html = f"{sender_info}<hr/>{html_body}"
-#         else:
-#             formatted_html = html_body
-#         
-#         message = MessageSchema(
-#             subject=subject or "PrivateRoute Message",
-#             recipients=[recipient_email],
-#             body=formatted_html,
-#             subtype="html"
-#         )
-#         
-#         await fm.send_message(message)
-#         logger.info(f"HTML email sent successfully to {recipient_email}")
-#         return True
-#     except Exception as e:
-#         logger.error(f"Failed to send HTML email to {recipient_email}: {str(e)}")
-#         return False
+"""
+SMTP email delivery.
 
+Message notifications are not sent from the request path: send_message
+records an outbox event and the EmailSink (app/outbox_sinks.py) sends them in
+batches over one SMTPConnection. send_email and send_html_email
+remain for one-off mails and open their own connection.
+
+Enable with ENABLE_EMAIL=True and the MAIL_* settings in .env.
+"""
+import html as html_lib
+import logging
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Optional
+import aiosmtplib
+from app.database import settings
+
+logger = logging.getLogger(__name__)
+
+
+def build_email(
+    recipient_email: str,
+    subject: Optional[str],
+    body: str,
+    sender_name: Optional[str] = None,
+    sender_email: Optional[str] = None,
+    html: bool = False
+) -> EmailMessage:
+    """Build a message from the configured sender, crediting the PrivateRoute user who wrote it."""
+    if sender_name:
+        if html:
+            # Users pick their own display name; keep it from injecting markup
+            sender_info = html_lib.escape(sender_name)
+            if sender_email:
+                sender_info = f"{sender_info} ({html_lib.escape(sender_email)})"
+            body = f"<p><strong>From:</strong> {sender_info}</p><hr/>{body}"
+        else:
+            sender_info = f"{sender_name} ({sender_email})" if sender_email else sender_name
+            body = f"From: {sender_info}\n\n{body}"
+
+    message = EmailMessage()
+    message["From"] = formataddr((settings.mail_from_name, settings.mail_from))
+    message["To"] = recipient_email
+    message["Subject"] = subject or "PrivateRoute Message"
+    if sender_email:
+        message["Reply-To"] = sender_email
+    message.set_content(body, subtype="html" if html else "plain")
+    return message
+
+
+class SMTPConnection:
+    """
+    One authenticated SMTP session, reused for every message sent inside the
+    async with block.
+    """
+
+    def __init__(self):
+        self._smtp = aiosmtplib.SMTP(
+            hostname=settings.mail_server,
+            port=settings.mail_port,
+            username=settings.mail_username or None,
+            password=settings.mail_password or None,
+            use_tls=settings.mail_ssl_tls,
+            start_tls=settings.mail_starttls,
+            timeout=settings.mail_timeout_seconds,
+        )
+
+    async def __aenter__(self) -> "SMTPConnection":
+        await self._smtp.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self._smtp.quit()
+        except aiosmtplib.SMTPException:
+            self._smtp.close()
+
+    async def send(self, message: EmailMessage):
+        await self._smtp.send_message(message)
+
+
+async def send_email(
+    recipient_email: str,
+    subject: str,
+    body: str,
+    sender_name: Optional[str] = None,
+    sender_email: Optional[str] = None
+) -> bool:
+    """
+    Send a plain text email to a recipient.
+    Returns True if the email was sent successfully, False otherwise.
+    """
+    return await _send_one(build_email(recipient_email, subject, body, sender_name, sender_email))
+
+
+async def send_html_email(
+    recipient_email: str,
+    subject: str,
+    html_body: str,
+    sender_name: Optional[str] = None,
+    sender_email: Optional[str] = None
+) -> bool:
+    """
+    Send an HTML email to a recipient.
+    Returns True if the email was sent successfully, False otherwise.
+    """
+    return await _send_one(build_email(recipient_email, subject, html_body, sender_name, sender_email, html=True))
+
+
+async def _send_one(message: EmailMessage) -> bool:
+    if not settings.enable_email:
+        logger.warning("Email sending is disabled")
+        return False
+    try:
+        async with SMTPConnection() as connection:
+            await connection.send(message)
+        logger.info(f"Email sent successfully to {message['To']}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send email to {message['To']}: {str(e)}")
+        return False
@@ -0,0 +1,109 @@
+"""
+HTTP caching for read-mostly reference data (departments, roles).
+
+Each reference table has a version counter in TableVersion, bumped with
+bump() in the same transaction as every write to the table. The
+ReferenceCache keeps the serialized JSON of each response keyed by the
+table version it was built at, and tags it with an ETag derived from that
+version, so a repeat request is answered from memory (or with 304 when the
+client sends the tag back) without querying the table.
+
+The version itself is re-read from the database at most every
+max_age_seconds; writes through this process invalidate it at once, writes
+through other workers are picked up within max_age_seconds.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import Response, status
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.database import settings
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison, as If-None-Match requires
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+async def bump(db: AsyncSession, table: str) -> int:
+    """
+    Bump the version of a table and return the new version. Does not commit;
+    call invalidate() after committing.
+    """
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    statement = insert(models.TableVersion).values(name=table, version=1)
+    result = await db.execute(statement.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"version": models.TableVersion.version + 1}
+    ).returning(models.TableVersion.version))
+    return result.scalar_one()
+
+
+class ReferenceCache:
+    def __init__(self, max_age_seconds: float, maxsize: int):
+        self.max_age_seconds = max_age_seconds
+        self.maxsize = maxsize
+        # table -> (version, monotonic time it was read)
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        # (table, key) -> (version, JSON body)
+        self._responses: "OrderedDict[Tuple[str, Hashable], Tuple[int, bytes]]" = OrderedDict()
+
+    async def version(self, db: AsyncSession, table: str) -> int:
+        cached = self._versions.get(table)
+        if cached is not None and time.monotonic() - cached[1] <= self.max_age_seconds:
+            return cached[0]
+        result = await db.execute(select(models.TableVersion.version).filter(models.TableVersion.name == table))
+        version = result.scalar_one_or_none() or 0
+        self._versions[table] = (version, time.monotonic())
+        return version
+
+    def invalidate(self, table: str):
+        """Forget the table's version so the next request re-reads it."""
+        self._versions.pop(table, None)
+
+    async def respond(
+        self,
+        db: AsyncSession,
+        table: str,
+        key: Hashable,
+        if_none_match: Optional[str],
+        load: Callable[[], Awaitable[Any]],
+        adapter: TypeAdapter
+    ) -> Response:
+        """
+        The response for key, built with load() and serialized with adapter
+        only when the table version has moved since it was cached.
+        If-None-Match is honoured only once the key has loaded at the
+        current version, so an error raised by load() (a 404 for an id that
+        does not exist) is never answered with 304.
+        """
+        # Read the version before loading: a write in between bumps it, so a
+        # cached body can only be newer than its tag, never older
+        version = await self.version(db, table)
+        etag = f'"{table}.{version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        cache_key = (table, key)
+        entry = self._responses.get(cache_key)
+        if entry is None or entry[0] != version:
+            entry = (version, adapter.dump_json(adapter.validate_python(await load(), from_attributes=True)))
+            self._responses[cache_key] = entry
+            while len(self._responses) > self.maxsize:
+                self._responses.popitem(last=False)
+        self._responses.move_to_end(cache_key)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=entry[1], media_type="application/json", headers=headers)
+
+
+reference_cache = ReferenceCache(
+    max_age_seconds=settings.reference_cache_max_age_seconds,
+    maxsize=settings.reference_cache_size
+)
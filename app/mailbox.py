@@ -0,0 +1,56 @@
+"""
+Per-user high-water marks for the /received and /sent listings.
+
+Every change to a user's listings (a message sent or received, an email
+status update on a sent message) bumps received_version or sent_version in
+UserMailbox, in the same transaction as the change. The listings derive
+their ETag from it, so a conditional request is answered with 304 after one
+primary-key lookup, without running the listing query.
+
+bump_mailboxes() must run before the MessageLog insert: the upsert locks the
+mailbox rows, so messages for the same user get their ids, and commit, in
+lock order. A client that has seen id N can then ask for id > N (since_id)
+without missing a message committed late with a lower id.
+"""
+from collections import Counter
+from typing import Iterable
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+
+
+async def bump_mailboxes(db: AsyncSession, received_user_ids: Iterable[int] = (), sent_user_ids: Iterable[int] = ()):
+    """Bump the versions of the given users' mailboxes with one upsert. Does not commit."""
+    received = Counter(received_user_ids)
+    sent = Counter(sent_user_ids)
+    # Sorted so concurrent transactions lock the rows in the same order
+    rows = [
+        {"user_id": user_id, "received_version": received[user_id], "sent_version": sent[user_id]}
+        for user_id in sorted(received.keys() | sent.keys())
+    ]
+    if not rows:
+        return
+    table = models.UserMailbox.__table__
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    statement = insert(table)
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                "received_version": table.c.received_version + statement.excluded.received_version,
+                "sent_version": table.c.sent_version + statement.excluded.sent_version,
+            }
+        ),
+        rows
+    )
+
+
+async def mailbox_version(db: AsyncSession, user_id: int, version_column) -> int:
+    result = await db.execute(select(version_column).filter(models.UserMailbox.user_id == user_id))
+    return result.scalar_one_or_none() or 0
+
+
+def mailbox_etag(user_id: int, version: int) -> str:
+    return f'W/"{user_id}.{version}"'
+
@@ -1,6 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from fastapi.responses import PlainTextResponse
+from app.database import engine, Base, get_pool_status
+from app.metrics import MetricsMiddleware, instrument_engine, registry as metrics_registry
+from app.rule_expiry import rule_expiry_scheduler
+from app.password_hasher import password_hashing_pool
+from app.outbox import outbox_dispatcher
+from app.outbox_sinks import register_default_sinks
+from app.pubsub import pubsub
 from app.routers import auth, users, departments, roles, communication_rules, messages, audit
 
 app = FastAPI(
@@ -9,6 +16,8 @@ app = FastAPI(
     version="1.0.0"
 )
 
+instrument_engine(engine)
+
 
 @app.on_event("startup")
 async def create_tables():
@@ -16,6 +25,51 @@ async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+
+@app.on_event("startup")
+async def start_rule_expiry_scheduler():
+    """Load pending rule expiries and start deactivating them as they lapse."""
+    await rule_expiry_scheduler.start()
+
+
+@app.on_event("startup")
+async def start_outbox_dispatcher():
+    """Register the configured outbox sinks and deliver their pending events in the background."""
+    register_default_sinks()
+    if outbox_dispatcher.sinks:
+        outbox_dispatcher.start()
+
+
+@app.on_event("startup")
+async def start_pubsub():
+    """Connect the pub/sub backend that fans inbox events out to live streams."""
+    await pubsub.start()
+
+
+@app.on_event("shutdown")
+async def stop_rule_expiry_scheduler():
+    await rule_expiry_scheduler.stop()
+
+
+@app.on_event("shutdown")
+async def stop_outbox_dispatcher():
+    await outbox_dispatcher.stop()
+
+
+@app.on_event("shutdown")
+async def stop_pubsub():
+    await pubsub.stop()
+
+
+@app.on_event("shutdown")
+async def stop_password_hashing_pool():
+    password_hashing_pool.shutdown()
+
+
+@app.on_event("shutdown")
+async def dispose_engine():
+    await engine.dispose()
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +79,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Added last so it is outermost and times the whole request, CORS included
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -48,3 +105,13 @@ def root():
 def health_check():
     return {"status": "healthy"}
 
+
+@app.get("/health/db-pool")
+def db_pool_status():
+    return get_pool_status()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Request, query and pool metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,84 @@
+"""
+Incrementally maintained message statistics.
+
+Every logged message bumps two rollups in the same transaction: counts per
+(day, sender department, receiver department, status) and per
+(day, sender, status). Both are written as one upsert per table, so a bulk
+send costs the same two statements as a single one. Days are UTC dates, both
+here (today()) and in the backfill (utc_day()), whatever the server's zone.
+"""
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
+from app import models
+
+# (day, sender_id, sender_dept_id, receiver_dept_id, status)
+MessageFact = Tuple[date, int, int, int, str]
+
+
+def _upsert(dialect_name: str, table, key_columns: list[str]):
+    """
+    Upsert statement executed with a list of rows (executemany), so it is
+    compiled once and cached however many rows a call carries, and a large
+    backfill chunk stays under SQLite's bind parameter limit.
+    """
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={"message_count": table.c.message_count + statement.excluded.message_count}
+    )
+
+
+async def record_messages(db: AsyncSession, facts: Iterable[MessageFact]):
+    """Add the given messages to both rollups. Does not commit."""
+    dept_counts = Counter()
+    user_counts = Counter()
+    for day, sender_id, sender_dept_id, receiver_dept_id, status in facts:
+        dept_counts[(day, sender_dept_id, receiver_dept_id, status)] += 1
+        user_counts[(day, sender_id, status)] += 1
+    await add_message_counts(db, dept_counts, user_counts)
+
+
+async def add_message_counts(db: AsyncSession, dept_counts: Counter, user_counts: Counter):
+    """
+    Add pre-aggregated counts to the rollups.
+    dept_counts is keyed by (day, sender_dept_id, receiver_dept_id, status),
+    user_counts by (day, sender_id, status).
+    """
+    dialect_name = db.get_bind().dialect.name
+    # Rows go in key order, so concurrent upserts lock shared keys in the same
+    # order and cannot deadlock (as in app.mailbox.bump_mailboxes)
+    if dept_counts:
+        await db.execute(
+            _upsert(dialect_name, models.MessageStatsDaily.__table__, ["day", "sender_dept_id", "receiver_dept_id", "status"]),
+            [
+                {"day": day, "sender_dept_id": sender_dept_id, "receiver_dept_id": receiver_dept_id,
+                 "status": status, "message_count": count}
+                for (day, sender_dept_id, receiver_dept_id, status), count in sorted(dept_counts.items())
+            ]
+        )
+    if user_counts:
+        await db.execute(
+            _upsert(dialect_name, models.UserMessageStatsDaily.__table__, ["day", "user_id", "status"]),
+            [
+                {"day": day, "user_id": user_id, "status": status, "message_count": count}
+                for (day, user_id, status), count in sorted(user_counts.items())
+            ]
+        )
+
+
+def today(now: Optional[datetime] = None) -> date:
+    return (now or datetime.now(timezone.utc)).date()
+
+
+def utc_day(timestamp, dialect_name: str):
+    """SQL expression for the UTC date of a timestamp column, matching today()."""
+    if dialect_name == "postgresql":
+        # date() of a timestamptz uses the session's TimeZone
+        return func.date(func.timezone("UTC", timestamp))
+    # SQLite stores timestamps as UTC text
+    return func.date(timestamp)
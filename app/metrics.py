@@ -0,0 +1,202 @@
+"""
+Prometheus-compatible request and database metrics.
+
+MetricsMiddleware times every HTTP request and labels it with the matched
+route template (not the raw path) and status code. SQLAlchemy cursor events
+on the engine count statements and their duration, attributed to the route
+of the request that issued them through a context variable.
+Metrics are kept per process and rendered in the Prometheus text format.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from app.database import get_pool_status, settings
+from app.query_profiler import QueryProfile, server_timing
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestDbStats:
+    """Statements issued while handling one request."""
+    __slots__ = ("queries", "duration", "profile")
+
+    def __init__(self, profile: Optional[QueryProfile] = None):
+        self.queries = 0
+        self.duration = 0.0
+        self.profile = profile
+
+
+current_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("current_request_db_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            # one counter per bucket plus +Inf, then sum
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.request_duration = Histogram(LATENCY_BUCKETS)
+        self.in_progress: Dict[str, int] = {}
+        self.db_queries: Dict[str, int] = {}
+        self.db_duration: Dict[str, float] = {}
+        self.db_queries_outside_requests = 0
+        self.db_duration_outside_requests = 0.0
+
+    def observe_request(self, method: str, route: str, status: int, duration: float, db_stats: RequestDbStats):
+        self.request_duration.observe((method, route, str(status)), duration)
+        if db_stats.queries:
+            self.db_queries[route] = self.db_queries.get(route, 0) + db_stats.queries
+            self.db_duration[route] = self.db_duration.get(route, 0.0) + db_stats.duration
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_request_duration_seconds HTTP request latency by route and status.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route, status), series in sorted(self.request_duration.series.items()):
+            labels = f'method="{method}",route="{_escape(route)}",status="{status}"'
+            cumulative = 0
+            for bound, count in zip(self.request_duration.buckets, series):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.request_duration.buckets)]
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {series[-1]}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+        lines += [
+            "# HELP http_requests_in_progress HTTP requests currently being handled.",
+            "# TYPE http_requests_in_progress gauge",
+        ]
+        for method, count in sorted(self.in_progress.items()):
+            lines.append(f'http_requests_in_progress{{method="{method}"}} {count}')
+
+        lines += [
+            "# HELP db_queries_total SQL statements executed, by the route that issued them.",
+            "# TYPE db_queries_total counter",
+        ]
+        for route, count in sorted(self.db_queries.items()):
+            lines.append(f'db_queries_total{{route="{_escape(route)}"}} {count}')
+        lines.append(f'db_queries_total{{route=""}} {self.db_queries_outside_requests}')
+
+        lines += [
+            "# HELP db_query_duration_seconds_total Time spent executing SQL statements, by route.",
+            "# TYPE db_query_duration_seconds_total counter",
+        ]
+        for route, duration in sorted(self.db_duration.items()):
+            lines.append(f'db_query_duration_seconds_total{{route="{_escape(route)}"}} {duration}')
+        lines.append(f'db_query_duration_seconds_total{{route=""}} {self.db_duration_outside_requests}')
+
+        pool = get_pool_status()
+        lines += [
+            "# HELP db_pool_checked_out Connections currently checked out of the pool.",
+            "# TYPE db_pool_checked_out gauge",
+            f"db_pool_checked_out {pool['checked_out']}",
+            "# HELP db_pool_checkouts_total Connections checked out of the pool.",
+            "# TYPE db_pool_checkouts_total counter",
+            f"db_pool_checkouts_total {pool['checkouts']}",
+            "# HELP db_pool_overflow_events_total Overflow connections opened beyond pool_size.",
+            "# TYPE db_pool_overflow_events_total counter",
+            f"db_pool_overflow_events_total {pool['overflow_events']}",
+            "# HELP db_pool_timeouts_total Checkouts that timed out waiting for a connection.",
+            "# TYPE db_pool_timeouts_total counter",
+            f"db_pool_timeouts_total {pool['timeouts']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware, so it adds no per-request task or body buffering."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        profiling = settings.query_profiling_enabled
+        db_stats = RequestDbStats(QueryProfile() if profiling else None)
+        token = current_request_db_stats.set(db_stats)
+        registry.in_progress[method] = registry.in_progress.get(method, 0) + 1
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profiling:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", server_timing(db_stats.queries, db_stats.duration, time.perf_counter() - start)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            registry.in_progress[method] -= 1
+            current_request_db_stats.reset(token)
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            registry.observe_request(method, route_path, status_code, duration, db_stats)
+            if profiling:
+                db_stats.profile.report(method, route_path, status_code, db_stats.duration)
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Count statements and their duration through cursor events on the engine."""
+
+    # Per connection stack of (execution context, start time); popped when the
+    # statement completes, or fails, so a failure cannot shift later timings
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append((context, time.perf_counter()))
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start_time"].pop()[1]
+        db_stats = current_request_db_stats.get()
+        if db_stats is None:
+            registry.db_queries_outside_requests += 1
+            registry.db_duration_outside_requests += duration
+        else:
+            db_stats.queries += 1
+            db_stats.duration += duration
+            if db_stats.profile is not None:
+                db_stats.profile.record(statement, duration)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is None:
+            return
+        started = conn.info.get("query_start_time")
+        # Errors raised while fetching come after after_cursor_execute has popped
+        if started and started[-1][0] is exception_context.execution_context:
+            started.pop()
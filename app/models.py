@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Text, Index, JSON, DDL, event
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -28,10 +29,10 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
+    name = Column(String(100), nullable=False, index=True)  # user search pages in name order
     email = Column(String(255), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
-    dept_id = Column(Integer, ForeignKey("departments.id"), nullable=False)
+    dept_id = Column(Integer, ForeignKey("departments.id"), nullable=False, index=True)  # communicable users, by department
     role_id = Column(Integer, ForeignKey("roles.id"), nullable=False)
     public_key = Column(Text, nullable=True)
     encrypted_private_key = Column(Text, nullable=True)
@@ -46,19 +47,75 @@ class User(Base):
     received_messages = relationship("MessageLog", foreign_keys="MessageLog.receiver_id", back_populates="receiver")
 
 
+# Substring search over user names and emails (see app.user_search). PostgreSQL
+# gets trigram GIN indexes, which serve ILIKE '%q%'; SQLite gets an external
+# content FTS5 table with the trigram tokenizer, kept in sync by triggers.
+USER_SEARCH_DDL = {
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_users_name_trgm ON users USING gin (name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+        "name, email, content='users', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+        "INSERT INTO users_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+        "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END",
+        "CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF name, email ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+        "INSERT INTO users_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    ],
+}
+
+for _dialect_name, _statements in USER_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(User.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect_name))
+# The FTS table is not part of the metadata, so drop it with users to avoid stale rows
+event.listen(User.__table__, "before_drop", DDL("DROP TABLE IF EXISTS users_fts").execute_if(dialect="sqlite"))
+
+
+# SQLite fills server_default=func.now() as 'YYYY-MM-DD HH:MM:SS'. Bind parameters
+# in the same format so that keyset comparisons on the column line up exactly.
+SQLITE_SERVER_TIMESTAMP = sqlite.DATETIME(
+    storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+)
+
+
+def _low_dept_id(context):
+    params = context.get_current_parameters()
+    return min(params["dept_a_id"], params["dept_b_id"])
+
+
+def _high_dept_id(context):
+    params = context.get_current_parameters()
+    return max(params["dept_a_id"], params["dept_b_id"])
+
+
 class CommunicationRule(Base):
     __tablename__ = "communication_rules"
+    __table_args__ = (
+        # Rules are undirected; lookups go through the canonical (low, high) pair
+        Index(
+            "ix_communication_rules_dept_pair",
+            "low_dept_id", "high_dept_id", "rule_type", "is_active",
+            postgresql_include=["expiry_timestamp", "user_specific", "requester_id"],
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     dept_a_id = Column(Integer, ForeignKey("departments.id"), nullable=False)
     dept_b_id = Column(Integer, ForeignKey("departments.id"), nullable=False)
+    low_dept_id = Column(Integer, nullable=False, default=_low_dept_id)
+    high_dept_id = Column(Integer, nullable=False, default=_high_dept_id)
     rule_type = Column(String(20), nullable=False)  # 'temporary' or 'permanent'
     requester_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     approved_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     expiry_timestamp = Column(DateTime(timezone=True), nullable=True)
     user_specific = Column(Boolean, default=False)
     reason = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True).with_variant(SQLITE_SERVER_TIMESTAMP, "sqlite"), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_active = Column(Boolean, default=True)
 
@@ -70,16 +127,87 @@ class CommunicationRule(Base):
 
 class MessageLog(Base):
     __tablename__ = "message_logs"
+    __table_args__ = (
+        # Log listings walk this newest first by (timestamp, id)
+        Index("ix_message_logs_timestamp", "timestamp", "id"),
+        # Mailbox pages and delta sync (since_id) read a user's messages in id order
+        Index("ix_message_logs_sender_id", "sender_id", "id"),
+        Index("ix_message_logs_receiver_id", "receiver_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     subject = Column(String(255), nullable=True)
     message_content = Column(Text, nullable=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True).with_variant(SQLITE_SERVER_TIMESTAMP, "sqlite"), server_default=func.now())
     status = Column(String(50), nullable=False)  # 'sent', 'blocked', 'pending'
     reason = Column(Text, nullable=True)
+    # Email notification delivery, mirrored from its outbox event; NULL when no email is due
+    email_status = Column(String(20), nullable=True)  # 'pending', 'sent', 'failed'
+    email_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    email_next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    email_error = Column(Text, nullable=True)
 
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_messages")
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_messages")
 
+
+# Version counters of read-mostly tables, bumped on every write (see app.http_cache
+# and, for communication_rules, app.permission_graph)
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# Per-user change counters for /received and /sent, bumped in the same
+# transaction as every change to the listings (see app.mailbox)
+class UserMailbox(Base):
+    __tablename__ = "user_mailboxes"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    received_version = Column(Integer, nullable=False, default=0)
+    sent_version = Column(Integer, nullable=False, default=0)
+
+
+# Side effects of a write, recorded in the same transaction and delivered by the
+# outbox dispatcher (see app.outbox). One row per (event, sink).
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # The dispatcher polls for pending events that are due, oldest first
+        Index("ix_outbox_events_pending", "status", "next_attempt_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    sink = Column(String(50), nullable=False)  # 'email', 'webhook', ...
+    event_type = Column(String(50), nullable=False)  # 'message.sent'
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # 'pending', 'in_flight', 'delivered', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)  # retry time, or lease expiry when in_flight
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+
+
+# Rollups of MessageLog counts, updated in the same transaction as the logs (see app.message_stats)
+class MessageStatsDaily(Base):
+    __tablename__ = "message_stats_daily"
+
+    day = Column(Date, primary_key=True)
+    sender_dept_id = Column(Integer, ForeignKey("departments.id"), primary_key=True)
+    receiver_dept_id = Column(Integer, ForeignKey("departments.id"), primary_key=True)
+    status = Column(String(50), primary_key=True)
+    message_count = Column(Integer, nullable=False, default=0)
+
+
+class UserMessageStatsDaily(Base):
+    __tablename__ = "user_message_stats_daily"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    status = Column(String(50), primary_key=True)
+    message_count = Column(Integer, nullable=False, default=0)
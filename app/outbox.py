@@ -0,0 +1,269 @@
+"""
+Transactional outbox.
+
+Writes with side effects outside the database (email, webhooks, push) record
+them with enqueue() in the same transaction, as one OutboxEvent row per
+subscribed sink. Nothing is delivered on the request path: the side effects
+commit or roll back with the write, and a send costs one extra INSERT.
+
+The OutboxDispatcher works through due events in batches, in three steps so
+that no transaction or pooled connection is held during network I/O:
+1. claim: a short transaction marks the batch 'in_flight' with a lease
+   (next_attempt_at = now + outbox_lease_seconds) and commits. FOR UPDATE
+   SKIP LOCKED on PostgreSQL lets several processes claim side by side.
+2. deliver: each sink gets its share of the batch in one deliver() call,
+   outside any transaction.
+3. record: a second short transaction writes the outcomes back, and lets
+   sinks mirror them, only for events still held under this claim's lease.
+An event whose lease ran out (its dispatcher died or overran) is claimed
+again. Failures are retried with exponential backoff until
+outbox_max_attempts, then marked 'failed'; a sink reports a failure as
+permanent to skip the retries. Delivery is at least once, so sinks pass the
+event id along for deduplication. Sinks are registered at startup (see
+app.outbox_sinks).
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.database import AsyncSessionLocal, settings
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_SENT = "message.sent"
+
+
+class DeliveryResult(NamedTuple):
+    error: Optional[str] = None
+    permanent: bool = False
+
+
+DELIVERED = DeliveryResult()
+
+
+class OutboxSink:
+    """A delivery target. Subclasses set name and event_types and implement deliver()."""
+    name: str = ""
+    event_types: frozenset = frozenset()
+
+    async def deliver(self, events: List[models.OutboxEvent]) -> Dict[int, DeliveryResult]:
+        """
+        Deliver a batch. Returns event id -> result; events without a result
+        are retried. Runs outside any transaction: a sink that needs the
+        database opens a short session of its own, before its network I/O.
+        """
+        raise NotImplementedError
+
+    async def record_outcomes(self, db: AsyncSession, events: List[models.OutboxEvent], updates: List[dict]):
+        """Called with the batch's OutboxEvent updates in the same transaction, to mirror them elsewhere."""
+
+    async def close(self):
+        """Release connections held between batches."""
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        batch_size: int,
+        poll_interval_seconds: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float,
+        lease_seconds: float
+    ):
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.lease_seconds = lease_seconds
+        self.sinks: Dict[str, OutboxSink] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, sink: OutboxSink):
+        self.sinks[sink.name] = sink
+
+    def has_sink(self, name: str) -> bool:
+        return name in self.sinks
+
+    async def enqueue(self, db: AsyncSession, event_type: str, payloads: List[dict]) -> int:
+        """
+        Record an event per payload for every sink subscribed to event_type,
+        with a single INSERT. Does not commit; call notify() after committing.
+        Returns the number of rows written.
+        """
+        rows = [
+            {"sink": sink.name, "event_type": event_type, "payload": payload, "status": "pending", "attempts": 0}
+            for sink in self.sinks.values() if event_type in sink.event_types
+            for payload in payloads
+        ]
+        if rows:
+            await db.execute(insert(models.OutboxEvent), rows)
+        return len(rows)
+
+    def notify(self):
+        """Wake the dispatcher after committing new events."""
+        self._wakeup.set()
+
+    def backoff(self, attempts: int) -> timedelta:
+        return timedelta(seconds=min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempts - 1)))
+
+    async def dispatch_due(self, now: Optional[datetime] = None) -> int:
+        """Dispatch every pending event that is due, batch by batch. Returns the number of events attempted."""
+        processed = 0
+        while True:
+            attempted = await self._dispatch_batch(now or datetime.now(timezone.utc))
+            processed += attempted
+            if attempted < self.batch_size:
+                return processed
+
+    async def _dispatch_batch(self, now: datetime) -> int:
+        events, lease_until = await self._claim(now)
+        if not events:
+            return 0
+
+        by_sink = defaultdict(list)
+        for outbox_event in events:
+            by_sink[outbox_event.sink].append(outbox_event)
+
+        outcomes = []
+        for sink_name, sink_events in by_sink.items():
+            sink = self.sinks[sink_name]
+            missing = DeliveryResult("No delivery result from sink")
+            try:
+                results = await sink.deliver(sink_events)
+            except Exception as e:
+                logger.error(f"Outbox sink {sink_name} failed: {str(e)}")
+                results = {}
+                missing = DeliveryResult(f"{type(e).__name__}: {str(e)}")
+            updates = [
+                self._outcome(outbox_event, results.get(outbox_event.id, missing), now)
+                for outbox_event in sink_events
+            ]
+            outcomes.append((sink, sink_events, updates))
+
+        await self._record(outcomes, lease_until)
+        return len(events)
+
+    async def _claim(self, now: datetime) -> Tuple[List[models.OutboxEvent], datetime]:
+        """Mark a batch of due events in_flight under a lease, in a transaction of its own."""
+        event = models.OutboxEvent
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(event)
+                .filter(
+                    or_(
+                        and_(event.status == "pending",
+                             or_(event.next_attempt_at == None, event.next_attempt_at <= now)),
+                        # Claimed by a dispatcher that died or overran its lease
+                        and_(event.status == "in_flight", event.next_attempt_at <= now)
+                    ),
+                    event.sink.in_(list(self.sinks))
+                )
+                .order_by(event.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            events = result.scalars().all()
+            if events:
+                await db.execute(
+                    update(event)
+                    .where(event.id.in_([outbox_event.id for outbox_event in events]))
+                    .values(status="in_flight", next_attempt_at=lease_until)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        return events, lease_until
+
+    async def _record(self, outcomes: list, lease_until: datetime):
+        """
+        Write the outcomes back in one short transaction. Events whose lease
+        ran out and were claimed again belong to the new claim: neither their
+        row nor the sink's mirror of it (record_outcomes) is touched.
+        """
+        event = models.OutboxEvent
+        async with AsyncSessionLocal() as db:
+            for sink, sink_events, updates in outcomes:
+                # Lock the events still held under this lease, so they cannot
+                # be claimed again before the outcomes are committed
+                result = await db.execute(
+                    update(event)
+                    .where(
+                        event.id.in_([outbox_event.id for outbox_event in sink_events]),
+                        event.status == "in_flight",
+                        event.next_attempt_at == lease_until
+                    )
+                    .values(next_attempt_at=lease_until)
+                    .returning(event.id)
+                    .execution_options(synchronize_session=False)
+                )
+                held = set(result.scalars().all())
+                if len(held) < len(sink_events):
+                    logger.warning(
+                        f"Outbox sink {sink.name}: lease expired on {len(sink_events) - len(held)} events, "
+                        "dropping their outcomes"
+                    )
+                held_events = [outbox_event for outbox_event in sink_events if outbox_event.id in held]
+                held_updates = [outcome for outcome in updates if outcome["id"] in held]
+                if not held_updates:
+                    continue
+                await sink.record_outcomes(db, held_events, held_updates)
+                # Bulk UPDATE by primary key, one executemany per sink
+                await db.execute(update(event), held_updates)
+            await db.commit()
+
+    def _outcome(self, outbox_event: models.OutboxEvent, result: DeliveryResult, now: datetime) -> dict:
+        attempts = outbox_event.attempts + 1
+        if result.error is None:
+            return {"id": outbox_event.id, "status": "delivered", "attempts": attempts,
+                    "next_attempt_at": None, "last_error": None, "delivered_at": now}
+        if result.permanent or attempts >= self.max_attempts:
+            return {"id": outbox_event.id, "status": "failed", "attempts": attempts,
+                    "next_attempt_at": None, "last_error": result.error, "delivered_at": None}
+        return {"id": outbox_event.id, "status": "pending", "attempts": attempts,
+                "next_attempt_at": now + self.backoff(attempts), "last_error": result.error, "delivered_at": None}
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                dispatched = await self.dispatch_due()
+                if dispatched:
+                    logger.info(f"Dispatched {dispatched} outbox events")
+            except Exception as e:
+                logger.error(f"Failed to dispatch outbox events: {str(e)}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for sink in self.sinks.values():
+            await sink.close()
+
+
+outbox_dispatcher = OutboxDispatcher(
+    batch_size=settings.outbox_batch_size,
+    poll_interval_seconds=settings.outbox_poll_interval_seconds,
+    max_attempts=settings.outbox_max_attempts,
+    retry_base_seconds=settings.outbox_retry_base_seconds,
+    retry_max_seconds=settings.outbox_retry_max_seconds,
+    lease_seconds=settings.outbox_lease_seconds
+)
@@ -0,0 +1,149 @@
+"""
+Outbox sinks for message events.
+
+- EmailSink emails the receiver of each sent message, sending the whole batch
+  over one SMTP connection, and mirrors the delivery status onto the
+  MessageLog (email_status) so the API can report it.
+- WebhookSink POSTs each batch as one JSON document to WEBHOOK_URL, signed
+  with HMAC-SHA256 when WEBHOOK_SECRET is set, over a kept-alive client.
+
+Other sinks (push, ...) subclass OutboxSink and are registered the same way.
+"""
+import hashlib
+import hmac
+import json
+import logging
+from typing import Dict, List
+import aiosmtplib
+import httpx
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.database import AsyncSessionLocal, settings
+from app.email_service import SMTPConnection, build_email
+from app.mailbox import bump_mailboxes
+from app.outbox import DELIVERED, MESSAGE_SENT, DeliveryResult, OutboxSink, outbox_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# OutboxEvent.status -> MessageLog.email_status
+EMAIL_STATUSES = {"pending": "pending", "delivered": "sent", "failed": "failed"}
+
+
+class EmailSink(OutboxSink):
+    name = "email"
+    event_types = frozenset({MESSAGE_SENT})
+
+    async def deliver(self, events: List[models.OutboxEvent]) -> Dict[int, DeliveryResult]:
+        user_ids = {event.payload["sender_id"] for event in events} | {event.payload["receiver_id"] for event in events}
+        # Closed before connecting to SMTP, so no pooled connection waits on the mail server
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(models.User.id, models.User.name, models.User.email).filter(models.User.id.in_(user_ids))
+            )
+            users = {row.id: row for row in result.all()}
+
+        results = {}
+        try:
+            async with SMTPConnection() as connection:
+                for event in events:
+                    sender = users.get(event.payload["sender_id"])
+                    receiver = users.get(event.payload["receiver_id"])
+                    if receiver is None:
+                        results[event.id] = DeliveryResult("Receiver not found", permanent=True)
+                        continue
+                    try:
+                        email = build_email(
+                            receiver.email, event.payload["subject"], event.payload["message_content"] or "",
+                            sender.name if sender else None, sender.email if sender else None
+                        )
+                    except ValueError as e:
+                        # e.g. a line break in a header: retrying cannot fix it
+                        results[event.id] = DeliveryResult(f"Invalid email: {str(e)}", permanent=True)
+                        continue
+                    try:
+                        await connection.send(email)
+                        results[event.id] = DELIVERED
+                    except aiosmtplib.SMTPRecipientsRefused as e:
+                        results[event.id] = DeliveryResult(str(e), permanent=True)
+                    except aiosmtplib.SMTPServerDisconnected:
+                        raise
+                    except aiosmtplib.SMTPException as e:
+                        results[event.id] = DeliveryResult(str(e))
+        except Exception as e:
+            # Connection-level failure: everything not yet sent is retried
+            logger.error(f"SMTP delivery failed: {str(e)}")
+            for event in events:
+                results.setdefault(event.id, DeliveryResult(f"SMTP connection failed: {str(e)}"))
+        return results
+
+    async def record_outcomes(self, db: AsyncSession, events: List[models.OutboxEvent], updates: List[dict]):
+        await db.execute(update(models.MessageLog), [
+            {
+                "id": event.payload["message_id"],
+                "email_status": EMAIL_STATUSES[outcome["status"]],
+                "email_attempts": outcome["attempts"],
+                "email_next_attempt_at": outcome["next_attempt_at"],
+                "email_error": outcome["last_error"],
+            }
+            for event, outcome in zip(events, updates)
+        ])
+        # email_status shows in the sender's /sent listing
+        await bump_mailboxes(db, sent_user_ids=[event.payload["sender_id"] for event in events])
+
+
+class WebhookSink(OutboxSink):
+    name = "webhook"
+    event_types = frozenset({MESSAGE_SENT})
+
+    def __init__(self, url: str, secret: str = "", timeout_seconds: float = 10.0):
+        self.url = url
+        self.secret = secret
+        self.timeout_seconds = timeout_seconds
+        self._client = None
+
+    async def deliver(self, events: List[models.OutboxEvent]) -> Dict[int, DeliveryResult]:
+        body = json.dumps({"events": [
+            {
+                "id": event.id,
+                "type": event.event_type,
+                "created_at": event.created_at.isoformat() if event.created_at else None,
+                "data": event.payload,
+            }
+            for event in events
+        ]}).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            signature = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-PrivateRoute-Signature"] = f"sha256={signature}"
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout_seconds)
+        try:
+            response = await self._client.post(self.url, content=body, headers=headers)
+        except httpx.HTTPError as e:
+            logger.error(f"Webhook delivery failed: {str(e)}")
+            error = DeliveryResult(f"Webhook request failed: {type(e).__name__}: {str(e)}")
+            return {event.id: error for event in events}
+
+        if response.is_success:
+            return {event.id: DELIVERED for event in events}
+        # Client errors will not succeed on retry, except timeouts and rate limiting
+        permanent = 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+        error = DeliveryResult(f"Webhook returned HTTP {response.status_code}", permanent=permanent)
+        return {event.id: error for event in events}
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def register_default_sinks():
+    """Register the sinks enabled in settings with the outbox dispatcher."""
+    if settings.enable_email:
+        outbox_dispatcher.register(EmailSink())
+    if settings.webhook_url:
+        outbox_dispatcher.register(WebhookSink(
+            settings.webhook_url, settings.webhook_secret, settings.webhook_timeout_seconds
+        ))
@@ -0,0 +1,82 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Listings are ordered by (timestamp DESC, id DESC) and each page carries an
+opaque cursor encoding the (timestamp, id) of its last row. The next page
+starts strictly after that key, so its cost does not depend on how deep it
+is and rows inserted meanwhile do not shift between pages.
+
+A user's own messages are listed by id alone (id_paginate), newest first:
+the (sender_id, id) and (receiver_id, id) indexes serve both those pages
+and delta sync, so message_logs needs no per-user timestamp index.
+"""
+import base64
+from datetime import datetime
+from typing import Any, Optional, Sequence
+from fastapi import HTTPException, status
+from sqlalchemy import Select, literal, tuple_
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def encode_id_cursor(row_id: int) -> str:
+    return base64.urlsafe_b64encode(str(row_id).encode()).decode().rstrip("=")
+
+
+def decode_id_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def keyset_paginate(query: Select, timestamp_column, id_column, cursor: Optional[str], limit: int) -> Select:
+    """
+    Order the query newest first and start it after the cursor.
+    Fetches one extra row so next_page can tell whether there is more.
+    """
+    if cursor:
+        cursor_timestamp, cursor_id = decode_cursor(cursor)
+        # Typed literals so the cursor is bound exactly like the column values
+        query = query.filter(
+            tuple_(timestamp_column, id_column)
+            < tuple_(literal(cursor_timestamp, timestamp_column.type), literal(cursor_id, id_column.type))
+        )
+    return query.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def next_page(rows: Sequence[Any], limit: int, timestamp_attr: str = "timestamp") -> tuple[list, Optional[str]]:
+    """Split off the look-ahead row and build the cursor for the following page."""
+    items = list(rows[:limit])
+    if len(rows) > limit and items:
+        last = items[-1]
+        return items, encode_cursor(getattr(last, timestamp_attr), last.id)
+    return items, None
+
+
+def id_paginate(query: Select, id_column, cursor: Optional[str], limit: int) -> Select:
+    """keyset_paginate ordered by id alone, for listings with an (owner, id) index."""
+    if cursor:
+        query = query.filter(id_column < decode_id_cursor(cursor))
+    return query.order_by(id_column.desc()).limit(limit + 1)
+
+
+def next_id_page(rows: Sequence[Any], limit: int) -> tuple[list, Optional[str]]:
+    """next_page for id_paginate."""
+    items = list(rows[:limit])
+    if len(rows) > limit and items:
+        return items, encode_id_cursor(items[-1].id)
+    return items, None
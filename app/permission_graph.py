@@ -0,0 +1,351 @@
+"""
+In-memory department permission graph.
+
+Compiles the active communication rules into bitset adjacency so that
+check_communication_permission can answer without a database round trip.
+Department IDs are mapped to dense indexes; bit j of row i is set when
+department i may talk to department j.
+
+Writers patch the graph after committing (apply_rule, remove_rule,
+set_user_department). A patch that lands while rebuild() is reading or
+compiling may be missing from its result, so it is queued and replayed
+once the rebuilt tables are swapped in.
+
+The graph is per process. Every write to communication_rules also bumps
+its TableVersion row (app.http_cache.bump) in the same transaction, and
+ensure_loaded() compares that version with the one the graph is current
+with on every check: a rule revoked through another worker is never
+honoured here after its commit. A local patch passes the version its write
+bumped to, which moves the graph along without a rebuild when no other
+worker wrote in between.
+
+rebuild() compiles on a worker thread into a fresh graph and swaps the
+tables in at once, so a large rule set does not stall the event loop. A
+graph that is merely older than max_age_seconds keeps answering while it
+is refreshed in the background.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app import models
+from app.database import AsyncSessionLocal, settings
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[int, int]
+
+# TableVersion row bumped with every write to communication_rules
+RULES_VERSION = "communication_rules"
+
+REBUILD_CHUNK_SIZE = 5000
+
+# Tables replaced wholesale when a rebuilt graph is swapped in
+_TABLES = (
+    "_dept_index", "_permanent", "_temporary", "_temporary_expiry",
+    "_user_grants", "_rules", "_pair_rules", "_user_dept"
+)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """SQLite hands back naive datetimes; treat them as UTC."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _later(a: Optional[datetime], b: Optional[datetime]) -> Optional[datetime]:
+    """Latest of two expiries, where None means the rule never expires."""
+    if a is None or b is None:
+        return None
+    return max(a, b)
+
+
+async def rules_version(db: AsyncSession) -> int:
+    result = await db.execute(
+        select(models.TableVersion.version).filter(models.TableVersion.name == RULES_VERSION)
+    )
+    return result.scalar_one_or_none() or 0
+
+
+async def _fetch_in_chunks(db: AsyncSession, query) -> list:
+    """All rows of query, read in chunks so the event loop gets a turn between them."""
+    rows = []
+    result = await db.stream(query.execution_options(yield_per=REBUILD_CHUNK_SIZE))
+    async for partition in result.partitions():
+        rows.extend(partition)
+    return rows
+
+
+def _pair(dept_a_id: int, dept_b_id: int) -> Pair:
+    return (dept_a_id, dept_b_id) if dept_a_id <= dept_b_id else (dept_b_id, dept_a_id)
+
+
+class _CompiledRule:
+    __slots__ = ("id", "pair", "rule_type", "user_specific", "requester_id", "expiry")
+
+    def __init__(self, rule: models.CommunicationRule):
+        self.id = rule.id
+        self.pair = _pair(rule.dept_a_id, rule.dept_b_id)
+        self.rule_type = rule.rule_type
+        self.user_specific = bool(rule.user_specific)
+        self.requester_id = rule.requester_id
+        self.expiry = _as_utc(rule.expiry_timestamp)
+
+
+class PermissionGraph:
+    """
+    Bitset adjacency for permanent and department-wide temporary rules,
+    plus a side table for user-specific temporary rules.
+    """
+
+    def __init__(self, max_age_seconds: float = 60.0):
+        self.max_age_seconds = max_age_seconds
+        self._lock = asyncio.Lock()
+        self._loaded_at: Optional[float] = None
+        # RULES_VERSION the graph is current with
+        self._version: Optional[int] = None
+        # Patches made while a rebuild runs, replayed on top of its result
+        self._pending: Optional[List[Tuple[Callable[[], None], Optional[int]]]] = None
+        self._refresh: Optional[asyncio.Task] = None
+        self._reset()
+
+    def _reset(self):
+        self._dept_index: Dict[int, int] = {}
+        self._permanent: list[int] = []
+        self._temporary: list[int] = []
+        # Latest expiry of the department-wide temporary rules on a pair (None = never)
+        self._temporary_expiry: Dict[Pair, Optional[datetime]] = {}
+        # pair -> requester_id -> latest expiry of their user-specific rules
+        self._user_grants: Dict[Pair, Dict[int, Optional[datetime]]] = {}
+        self._rules: Dict[int, _CompiledRule] = {}
+        self._pair_rules: Dict[Pair, Set[int]] = {}
+        self._user_dept: Dict[int, int] = {}
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    @property
+    def is_stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return time.monotonic() - self._loaded_at > self.max_age_seconds
+
+    def _is_current(self, version: int) -> bool:
+        return self._loaded_at is not None and self._version == version
+
+    async def ensure_loaded(self, db: AsyncSession):
+        """
+        Build the graph on first use and rebuild it when communication_rules
+        has been written since (one primary-key read per call). Once it is
+        older than max_age_seconds, refresh it in the background.
+        """
+        version = await rules_version(db)
+        if not self._is_current(version):
+            async with self._lock:
+                if not self._is_current(version):
+                    await self.rebuild(db)
+        elif self.is_stale and (self._refresh is None or self._refresh.done()):
+            self._refresh = asyncio.create_task(self._refresh_in_background())
+
+    async def _refresh_in_background(self):
+        try:
+            async with self._lock:
+                if self.is_stale:
+                    async with AsyncSessionLocal() as db:
+                        await self.rebuild(db)
+        except Exception as e:
+            logger.error(f"Failed to refresh the permission graph: {str(e)}")
+
+    async def rebuild(self, db: AsyncSession):
+        """
+        Recompile the whole graph from the database, on a worker thread, and
+        swap the result in.
+        """
+        rule = models.CommunicationRule
+        self._pending = []
+        try:
+            # Read first: a write committed after it moves the version past
+            # this graph's, and the next check rebuilds again
+            version = await rules_version(db)
+            rules = await _fetch_in_chunks(db, select(
+                rule.id, rule.dept_a_id, rule.dept_b_id, rule.rule_type,
+                rule.user_specific, rule.requester_id, rule.expiry_timestamp
+            ).filter(rule.is_active == True))
+            users = await _fetch_in_chunks(db, select(models.User.id, models.User.dept_id))
+            built = type(self)(self.max_age_seconds)
+            await asyncio.get_running_loop().run_in_executor(None, built._load, users, rules)
+        finally:
+            pending, self._pending = self._pending, None
+
+        for name in _TABLES:
+            setattr(self, name, getattr(built, name))
+        self._version = version
+        # Patches are idempotent, so replaying one the SELECTs already saw is harmless
+        for patch, patch_version in pending:
+            self._apply(patch, patch_version)
+        self._loaded_at = time.monotonic()
+
+    def _load(self, users: list, rules: list):
+        """Fill an empty graph. Touches nothing shared, so it can run off the event loop."""
+        for user_id, dept_id in users:
+            self._user_dept[user_id] = dept_id
+        for row in rules:
+            compiled = _CompiledRule(row)
+            self._rules[compiled.id] = compiled
+            self._pair_rules.setdefault(compiled.pair, set()).add(compiled.id)
+        # Once per pair rather than once per rule
+        for pair in list(self._pair_rules):
+            self._recompute_pair(pair)
+
+    def invalidate(self):
+        """Force a full rebuild on next use."""
+        self._loaded_at = None
+
+    # ------------------------------------------------------------------
+    # Incremental patches
+    # ------------------------------------------------------------------
+
+    def apply_rule(self, rule: models.CommunicationRule, version: Optional[int] = None):
+        """
+        Add, update or drop a rule according to its current is_active flag.
+        version is the RULES_VERSION the write bumped to, if it did.
+        """
+        rule_id = rule.id
+        # Compiled now: the ORM object may change before a queued patch is replayed
+        compiled = _CompiledRule(rule) if rule.is_active else None
+        self._patch(lambda: self._replace_rule(rule_id, compiled), version)
+
+    def remove_rule(self, rule_id: int, version: Optional[int] = None):
+        self._patch(lambda: self._replace_rule(rule_id, None), version)
+
+    def set_user_department(self, user_id: int, dept_id: int):
+        def patch():
+            self._user_dept[user_id] = dept_id
+        self._patch(patch, None)
+
+    def _patch(self, patch: Callable[[], None], version: Optional[int]):
+        """Apply a patch to the loaded graph, and queue it if a rebuild is running."""
+        if self._pending is not None:
+            self._pending.append((patch, version))
+        if self._loaded_at is not None:
+            self._apply(patch, version)
+
+    def _apply(self, patch: Callable[[], None], version: Optional[int]):
+        patch()
+        # Current with the write's version only if it was with the one before:
+        # otherwise another worker wrote in between, and the next check rebuilds
+        if version is not None and self._version is not None and version == self._version + 1:
+            self._version = version
+
+    def _replace_rule(self, rule_id: int, compiled: Optional[_CompiledRule]):
+        previous = self._rules.pop(rule_id, None)
+        if previous is not None:
+            self._pair_rules[previous.pair].discard(rule_id)
+            self._recompute_pair(previous.pair)
+        if compiled is not None:
+            self._store(compiled)
+
+    def _store(self, compiled: _CompiledRule):
+        self._rules[compiled.id] = compiled
+        self._pair_rules.setdefault(compiled.pair, set()).add(compiled.id)
+        self._recompute_pair(compiled.pair)
+
+    def _index(self, dept_id: int) -> int:
+        index = self._dept_index.get(dept_id)
+        if index is None:
+            index = len(self._permanent)
+            self._dept_index[dept_id] = index
+            self._permanent.append(0)
+            self._temporary.append(0)
+        return index
+
+    def _set_bit(self, rows: list[int], pair: Pair, value: bool):
+        i, j = self._index(pair[0]), self._index(pair[1])
+        if value:
+            rows[i] |= 1 << j
+            rows[j] |= 1 << i
+        else:
+            rows[i] &= ~(1 << j)
+            rows[j] &= ~(1 << i)
+
+    def _recompute_pair(self, pair: Pair):
+        """Re-derive the adjacency bits and side tables for one pair from its rules."""
+        permanent = False
+        temporary = False
+        temporary_expiry: Optional[datetime] = None
+        grants: Dict[int, Optional[datetime]] = {}
+
+        for rule_id in self._pair_rules.get(pair, ()):
+            rule = self._rules[rule_id]
+            if rule.rule_type == "permanent":
+                permanent = True
+            elif rule.rule_type != "temporary":
+                continue
+            elif rule.user_specific:
+                if rule.requester_id is not None:
+                    if rule.requester_id in grants:
+                        grants[rule.requester_id] = _later(grants[rule.requester_id], rule.expiry)
+                    else:
+                        grants[rule.requester_id] = rule.expiry
+            else:
+                temporary_expiry = _later(temporary_expiry, rule.expiry) if temporary else rule.expiry
+                temporary = True
+
+        self._set_bit(self._permanent, pair, permanent)
+        self._set_bit(self._temporary, pair, temporary)
+        if temporary:
+            self._temporary_expiry[pair] = temporary_expiry
+        else:
+            self._temporary_expiry.pop(pair, None)
+        if grants:
+            self._user_grants[pair] = grants
+        else:
+            self._user_grants.pop(pair, None)
+        if not self._pair_rules.get(pair):
+            self._pair_rules.pop(pair, None)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def get_user_department(self, user_id: int) -> Optional[int]:
+        return self._user_dept.get(user_id)
+
+    def check(self, sender_id: int, sender_dept_id: int, receiver_dept_id: int,
+              now: Optional[datetime] = None) -> tuple[bool, str]:
+        """Same semantics as check_communication_permission, given both departments."""
+        if sender_dept_id == receiver_dept_id:
+            return True, "Same department"
+
+        i = self._dept_index.get(sender_dept_id)
+        j = self._dept_index.get(receiver_dept_id)
+        if i is None or j is None:
+            return False, "No communication rule found between departments"
+
+        if self._permanent[i] >> j & 1:
+            return True, "Permanent rule exists"
+
+        now = now or datetime.now(timezone.utc)
+        pair = _pair(sender_dept_id, receiver_dept_id)
+        if self._temporary[i] >> j & 1:
+            expiry = self._temporary_expiry.get(pair)
+            if expiry is None or expiry > now:
+                return True, "Temporary department-wide rule"
+
+        grants = self._user_grants.get(pair)
+        if grants:
+            live = [requester for requester, expiry in grants.items() if expiry is None or expiry > now]
+            if sender_id in live:
+                return True, "Temporary user-specific rule"
+            if live:
+                return False, "Temporary rule is user-specific and doesn't match sender"
+
+        return False, "No communication rule found between departments"
+
+
+permission_graph = PermissionGraph(max_age_seconds=settings.permission_graph_max_age_seconds)
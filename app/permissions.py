@@ -1,11 +1,24 @@
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import and_, or_, select
+from sqlalchemy import ColumnElement, and_, case, or_, select
 from app import models
+from app.permission_graph import permission_graph
 from fastapi import HTTPException, status
 
 
+def dept_pair_filter(dept_x_id: int, dept_y_id: int):
+    """
+    Match rules between two departments in either direction.
+    Compares the canonical (low_dept_id, high_dept_id) pair so the lookup is a
+    single probe on ix_communication_rules_dept_pair instead of an OR.
+    """
+    return and_(
+        models.CommunicationRule.low_dept_id == min(dept_x_id, dept_y_id),
+        models.CommunicationRule.high_dept_id == max(dept_x_id, dept_y_id)
+    )
+
+
 async def check_communication_permission(
     db: AsyncSession,
     sender_id: int,
@@ -16,212 +29,95 @@ async def check_communication_permission(
     Check if sender has permission to communicate with receiver.
     Returns (is_allowed, reason)
     """
-    # Get sender and receiver
-    sender_result = await db.execute(select(models.User).filter(models.User.id == sender_id))
-    sender = sender_result.scalar_one_or_none()
-    receiver_result = await db.execute(select(models.User).filter(models.User.id == receiver_id))
-    receiver = receiver_result.scalar_one_or_none()
-    
-    if not sender or not receiver:
-        return False, "Sender or receiver not found"
-    
-    # Same department - always allowed
-    if sender.dept_id == receiver.dept_id:
-        return True, "Same department"
-    
-    sender_dept_id = sender.dept_id
-    receiver_dept_id = receiver.dept_id
-    
-    # Check for active communication rules
-    now = datetime.now(timezone.utc)
-    
-    # Check for permanent rules
-    permanent_result = await db.execute(
-        select(models.CommunicationRule).filter(
-            and_(
-                models.CommunicationRule.is_active == True,
-                models.CommunicationRule.rule_type == "permanent",
-                or_(
-                    and_(
-                        models.CommunicationRule.dept_a_id == sender_dept_id,
-                        models.CommunicationRule.dept_b_id == receiver_dept_id
-                    ),
-                    and_(
-                        models.CommunicationRule.dept_a_id == receiver_dept_id,
-                        models.CommunicationRule.dept_b_id == sender_dept_id
-                    )
-                )
-            )
-        )
-    )
-    permanent_rule = permanent_result.scalar_one_or_none()
-    
-    if permanent_rule:
-        return True, "Permanent rule exists"
-    
-    # Check for temporary rules
-    temporary_result = await db.execute(
-        select(models.CommunicationRule).filter(
-            and_(
-                models.CommunicationRule.is_active == True,
-                models.CommunicationRule.rule_type == "temporary",
-                or_(
-                    models.CommunicationRule.expiry_timestamp == None,
-                    models.CommunicationRule.expiry_timestamp > now
-                ),
-                or_(
-                    and_(
-                        models.CommunicationRule.dept_a_id == sender_dept_id,
-                        models.CommunicationRule.dept_b_id == receiver_dept_id
-                    ),
-                    and_(
-                        models.CommunicationRule.dept_a_id == receiver_dept_id,
-                        models.CommunicationRule.dept_b_id == sender_dept_id
-                    )
-                )
-            )
-        )
-    )
-    temporary_rule = temporary_result.scalar_one_or_none()
-    
-    if temporary_rule:
-        # If user_specific, check if requester matches sender
-        if temporary_rule.user_specific:
-            if temporary_rule.requester_id == sender_id:
-                return True, "Temporary user-specific rule"
-            else:
-                return False, "Temporary rule is user-specific and doesn't match sender"
-        else:
-            return True, "Temporary department-wide rule"
-    
-    return False, "No communication rule found between departments"
+    results = await check_communication_permissions(db, sender_id, [receiver_id])
+    return results[receiver_id]
 
 
-async def get_communicable_users(
+async def check_communication_permissions(
     db: AsyncSession,
-    sender_id: int
-) -> List[models.User]:
+    sender_id: int,
+    receiver_ids: List[int]
+) -> dict[int, tuple[bool, str]]:
     """
-    Get all users that the sender can communicate with based on rules and permissions.
-    Returns a list of User objects.
+    Check permission from one sender to many receivers at once.
+    Answered from the in-memory permission graph; the database is only
+    consulted to (re)build the graph or to resolve users it has not seen yet,
+    in a single query however many receivers are passed.
+    Returns {receiver_id: (is_allowed, reason)}
     """
-    sender_result = await db.execute(select(models.User).filter(models.User.id == sender_id))
-    sender = sender_result.scalar_one_or_none()
-    if not sender:
-        return []
-    
-    sender_dept_id = sender.dept_id
-    now = datetime.now(timezone.utc)
+    await permission_graph.ensure_loaded(db)
     
-    # Start with users in the same department (always allowed)
-    same_dept_result = await db.execute(
-        select(models.User).filter(
-            and_(
-                models.User.dept_id == sender_dept_id,
-                models.User.id != sender_id  # Exclude self
-            )
+    user_ids = {sender_id, *receiver_ids}
+    unknown_ids = [user_id for user_id in user_ids if permission_graph.get_user_department(user_id) is None]
+    if unknown_ids:
+        users_result = await db.execute(
+            select(models.User.id, models.User.dept_id).filter(models.User.id.in_(unknown_ids))
         )
-    )
-    same_dept_users = same_dept_result.scalars().all()
+        for user_id, dept_id in users_result.all():
+            permission_graph.set_user_department(user_id, dept_id)
     
-    # Get all departments that have permanent rules with sender's department
-    permanent_rules_result = await db.execute(
-        select(models.CommunicationRule).filter(
-            and_(
-                models.CommunicationRule.is_active == True,
-                models.CommunicationRule.rule_type == "permanent",
-                or_(
-                    models.CommunicationRule.dept_a_id == sender_dept_id,
-                    models.CommunicationRule.dept_b_id == sender_dept_id
-                )
-            )
-        )
-    )
-    permanent_rules = permanent_rules_result.scalars().all()
-    
-    # Collect department IDs from permanent rules
-    allowed_dept_ids = set()
-    for rule in permanent_rules:
-        if rule.dept_a_id == sender_dept_id:
-            allowed_dept_ids.add(rule.dept_b_id)
+    now = datetime.now(timezone.utc)
+    sender_dept_id = permission_graph.get_user_department(sender_id)
+    results = {}
+    for receiver_id in receiver_ids:
+        receiver_dept_id = permission_graph.get_user_department(receiver_id)
+        if sender_dept_id is None or receiver_dept_id is None:
+            results[receiver_id] = (False, "Sender or receiver not found")
         else:
-            allowed_dept_ids.add(rule.dept_a_id)
+            results[receiver_id] = permission_graph.check(sender_id, sender_dept_id, receiver_dept_id, now)
+    return results
+
+
+def communicable_users_filter(sender_id: int, now: Optional[datetime] = None) -> ColumnElement:
+    """
+    Criterion on models.User matching the users the sender can communicate with.
+    The sender's department and every department reachable through a live
+    permanent, department-wide temporary or sender-owned user-specific
+    temporary rule are resolved as subqueries, so the database does all the work
+    and the criterion can be combined with other filters in the same statement.
+    """
+    now = now or datetime.now(timezone.utc)
+    rule = models.CommunicationRule
     
-    # Get users from departments with permanent rules
-    permanent_users = []
-    if allowed_dept_ids:
-        permanent_result = await db.execute(
-            select(models.User).filter(models.User.dept_id.in_(allowed_dept_ids))
-        )
-        permanent_users = permanent_result.scalars().all()
+    sender_dept_id = (
+        select(models.User.dept_id)
+        .filter(models.User.id == sender_id)
+        .scalar_subquery()
+    )
     
-    # Get temporary rules
-    temporary_rules_result = await db.execute(
-        select(models.CommunicationRule).filter(
+    live_rule = and_(
+        rule.is_active == True,
+        or_(
+            rule.rule_type == "permanent",
             and_(
-                models.CommunicationRule.is_active == True,
-                models.CommunicationRule.rule_type == "temporary",
+                rule.rule_type == "temporary",
                 or_(
-                    models.CommunicationRule.expiry_timestamp == None,
-                    models.CommunicationRule.expiry_timestamp > now
+                    rule.expiry_timestamp == None,
+                    rule.expiry_timestamp > now
                 ),
                 or_(
-                    models.CommunicationRule.dept_a_id == sender_dept_id,
-                    models.CommunicationRule.dept_b_id == sender_dept_id
+                    rule.user_specific.isnot(True),
+                    rule.requester_id == sender_id
                 )
             )
         )
     )
-    temporary_rules = temporary_rules_result.scalars().all()
-    
-    # Collect users from temporary rules
-    temporary_user_ids = set()
-    temporary_dept_ids = set()
     
-    for rule in temporary_rules:
-        if rule.user_specific:
-            # User-specific rule - only add if requester is the sender
-            if rule.requester_id == sender_id:
-                if rule.dept_a_id == sender_dept_id:
-                    # Get users from dept_b (target department)
-                    temp_result = await db.execute(
-                        select(models.User).filter(models.User.dept_id == rule.dept_b_id)
-                    )
-                    temp_users = temp_result.scalars().all()
-                    temporary_user_ids.update([u.id for u in temp_users])
-                else:
-                    # Get users from dept_a (target department)
-                    temp_result = await db.execute(
-                        select(models.User).filter(models.User.dept_id == rule.dept_a_id)
-                    )
-                    temp_users = temp_result.scalars().all()
-                    temporary_user_ids.update([u.id for u in temp_users])
-        else:
-            # Department-wide temporary rule
-            if rule.dept_a_id == sender_dept_id:
-                temporary_dept_ids.add(rule.dept_b_id)
-            else:
-                temporary_dept_ids.add(rule.dept_a_id)
-    
-    # Get users from departments with temporary rules
-    temporary_dept_users = []
-    if temporary_dept_ids:
-        temp_dept_result = await db.execute(
-            select(models.User).filter(models.User.dept_id.in_(temporary_dept_ids))
+    # The department on the other side of each rule touching the sender's department
+    reachable_dept_ids = select(
+        case((rule.dept_a_id == sender_dept_id, rule.dept_b_id), else_=rule.dept_a_id)
+    ).filter(
+        live_rule,
+        or_(
+            rule.dept_a_id == sender_dept_id,
+            rule.dept_b_id == sender_dept_id
         )
-        temporary_dept_users = temp_dept_result.scalars().all()
+    )
     
-    # Get specific users from temporary rules
-    temporary_specific_users = []
-    if temporary_user_ids:
-        temp_specific_result = await db.execute(
-            select(models.User).filter(models.User.id.in_(temporary_user_ids))
+    return and_(
+        models.User.id != sender_id,
+        or_(
+            models.User.dept_id == sender_dept_id,
+            models.User.dept_id.in_(reachable_dept_ids)
         )
-        temporary_specific_users = temp_specific_result.scalars().all()
-    
-    # Combine all users and remove duplicates
-    all_users = list(same_dept_users) + list(permanent_users) + list(temporary_dept_users) + list(temporary_specific_users)
-    unique_users = {user.id: user for user in all_users}.values()
-    
-    return list(unique_users)
-
+    )
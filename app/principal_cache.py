@@ -0,0 +1,93 @@
+"""
+Bounded LRU/TTL cache for authenticated principals.
+
+get_current_user keeps a detached snapshot of each user (with role and
+department) keyed by token subject, so repeat requests skip the user query.
+Entries expire after ttl_seconds and must be invalidated explicitly when the
+user, their role or their department changes. Invalidation only reaches this
+process, so other workers can serve a stale snapshot for up to ttl_seconds;
+the snapshot therefore leaves out password_hash, and anything that checks a
+password reads it from the database.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from app import models
+from app.database import settings
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Never cached: a stale copy would keep accepting an old password on other workers
+SNAPSHOT_EXCLUDED_COLUMNS = frozenset({"password_hash"})
+
+
+def snapshot_user(user: models.User) -> models.User:
+    """
+    Copy a loaded user, with its role and department, into a new object that
+    is not attached to any session. Treat the snapshot as read-only: it is
+    shared between requests. password_hash is left out.
+    """
+    snapshot = models.User(**{
+        column.key: getattr(user, column.key)
+        for column in models.User.__table__.columns
+        if column.key not in SNAPSHOT_EXCLUDED_COLUMNS
+    })
+    snapshot.role = models.Role(id=user.role.id, name=user.role.name)
+    snapshot.department = models.Department(id=user.department.id, name=user.department.name)
+    return snapshot
+
+
+principal_cache = TTLCache(
+    maxsize=settings.principal_cache_size,
+    ttl_seconds=settings.principal_cache_ttl_seconds
+)
@@ -0,0 +1,238 @@
+"""
+In-process pub/sub fan-out for live inbox updates.
+
+Connected clients subscribe to a channel (one per user) and read from a
+bounded asyncio.Queue. publish() fans an event out to every subscriber of
+the channel in this process without touching the database, and a channel
+nobody listens on costs a dict lookup, so idle users cost nothing. A
+subscriber that falls more than queue_size events behind is dropped rather
+than buffered without bound; its client reconnects and catches up.
+
+The backend carries events between processes:
+- MemoryBackend (default) hands them straight to the local fan-out.
+- PostgresBackend sends them with pg_notify and every worker LISTENs on a
+  dedicated asyncpg connection and fans out locally, so several uvicorn
+  workers share one stream. NOTIFY payloads are limited to 8000 bytes;
+  larger events are published without their "data" and marked truncated.
+  A batch from publish_many() goes out in one statement. When the LISTEN
+  connection drops (a database restart), it reconnects with exponential
+  backoff and ends every local stream, as events may have been missed
+  meanwhile; clients reconnect and replay from Last-Event-ID.
+"""
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncpg
+from sqlalchemy import Text, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from app.database import engine, settings
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, dict], None]
+Event = Tuple[str, dict]
+
+
+class Subscription:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Next event, or None if none arrives within timeout."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MemoryBackend:
+    """Single process: publishing is local delivery."""
+
+    def bind(self, deliver: Deliver, drop_all: Callable[[], None]):
+        self._deliver = deliver
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish_many(self, events: List[Event]):
+        for channel, event in events:
+            self._deliver(channel, event)
+
+
+class PostgresBackend:
+    """Shares events between workers through LISTEN/NOTIFY."""
+    notify_channel = "privateroute_pubsub"
+    max_payload_bytes = 7900
+
+    def __init__(self, dsn: str, reconnect_base_seconds: float = 1.0, reconnect_max_seconds: float = 30.0):
+        self.dsn = dsn
+        self.reconnect_base_seconds = reconnect_base_seconds
+        self.reconnect_max_seconds = reconnect_max_seconds
+        self._listener: Optional[asyncpg.Connection] = None
+        self._lost: Optional[asyncio.Event] = None
+        self._supervisor: Optional[asyncio.Task] = None
+
+    def bind(self, deliver: Deliver, drop_all: Callable[[], None]):
+        self._deliver = deliver
+        self._drop_all = drop_all
+
+    async def start(self):
+        self._lost = asyncio.Event()
+        await self._listen()
+        self._supervisor = asyncio.create_task(self._reconnect_when_lost())
+
+    async def stop(self):
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+            self._supervisor = None
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            await listener.close()
+
+    async def _listen(self):
+        listener = await asyncpg.connect(self.dsn)
+        try:
+            listener.add_termination_listener(self._on_termination)
+            await listener.add_listener(self.notify_channel, self._on_notify)
+        except BaseException:
+            await listener.close()
+            raise
+        self._listener = listener
+
+    def _on_termination(self, connection):
+        # Not for a connection stop() or a failed _listen() closed
+        if connection is self._listener:
+            self._listener = None
+            self._lost.set()
+
+    async def _reconnect_when_lost(self):
+        while True:
+            await self._lost.wait()
+            self._lost.clear()
+            logger.warning("Lost the pub/sub LISTEN connection, reconnecting")
+            delay = self.reconnect_base_seconds
+            while True:
+                try:
+                    await self._listen()
+                    break
+                except Exception as e:
+                    logger.error(f"Failed to reconnect the pub/sub LISTEN connection: {str(e)}")
+                    await asyncio.sleep(delay)
+                    delay = min(self.reconnect_max_seconds, delay * 2)
+            logger.info("Reconnected the pub/sub LISTEN connection")
+            # Events published while disconnected never arrived: end the
+            # streams so their clients reconnect and replay what they missed
+            self._drop_all()
+
+    def _on_notify(self, connection, pid, notify_channel, payload):
+        message = json.loads(payload)
+        self._deliver(message["channel"], message["event"])
+
+    def _payload(self, channel: str, event: dict) -> str:
+        payload = json.dumps({"channel": channel, "event": event})
+        if len(payload.encode()) > self.max_payload_bytes:
+            event = {key: value for key, value in event.items() if key != "data"}
+            payload = json.dumps({"channel": channel, "event": {**event, "truncated": True}})
+        return payload
+
+    async def publish_many(self, events: List[Event]):
+        payloads = func.unnest(
+            literal([self._payload(channel, event) for channel, event in events], ARRAY(Text))
+        ).table_valued("payload")
+        # Pooled connection, so concurrent publishes do not queue on the listener.
+        # One statement however many events: a NOTIFY per row, sent on commit
+        async with engine.begin() as conn:
+            await conn.execute(select(func.pg_notify(self.notify_channel, payloads.c.payload)).select_from(payloads))
+
+
+class PubSub:
+    def __init__(self, backend, queue_size: int):
+        self.backend = backend
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        backend.bind(self._deliver, self._drop_all)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[Subscription]:
+        subscription = Subscription(self.queue_size)
+        self._subscribers.setdefault(channel, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._unsubscribe(channel, subscription)
+
+    def _unsubscribe(self, channel: str, subscription: Subscription):
+        subscribers = self._subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[channel]
+
+    async def publish(self, channel: str, event: dict):
+        """Publish to every subscriber of channel. Failures are logged, never raised to the caller."""
+        await self.publish_many([(channel, event)])
+
+    async def publish_many(self, events: Iterable[Event]):
+        """Publish (channel, event) pairs in one round trip to the backend. Failures are logged, never raised."""
+        events = list(events)
+        if not events:
+            return
+        try:
+            await self.backend.publish_many(events)
+        except Exception as e:
+            logger.error(f"Failed to publish {len(events)} events: {str(e)}")
+
+    def _deliver(self, channel: str, event: dict):
+        for subscription in list(self._subscribers.get(channel, ())):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self._unsubscribe(channel, subscription)
+                logger.warning(f"Dropped a slow subscriber of {channel}")
+
+    def _drop_all(self):
+        """End every local stream; each client reconnects and catches up."""
+        for subscribers in self._subscribers.values():
+            for subscription in subscribers:
+                subscription.overflowed = True
+                try:
+                    # Wakes a stream waiting on an empty queue, like a keepalive timeout
+                    subscription.queue.put_nowait(None)
+                except asyncio.QueueFull:
+                    pass
+        self._subscribers.clear()
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def start(self):
+        await self.backend.start()
+
+    async def stop(self):
+        await self.backend.stop()
+
+
+def create_backend(name: str):
+    if name == "postgres":
+        return PostgresBackend(settings.async_database_url.replace("postgresql+asyncpg://", "postgresql://"))
+    if name != "memory":
+        raise ValueError(f"Unknown PUBSUB_BACKEND: {name}")
+    return MemoryBackend()
+
+
+def inbox_channel(user_id: int) -> str:
+    return f"inbox:{user_id}"
+
+
+pubsub = PubSub(create_backend(settings.pubsub_backend), settings.inbox_stream_queue_size)
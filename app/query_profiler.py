@@ -0,0 +1,97 @@
+"""
+Opt-in per-request SQL profiling (QUERY_PROFILING_ENABLED).
+
+When enabled, every statement a request executes is recorded with its
+duration and the application line that issued it. After the response the
+request is logged with its query count, DB time and slowest statements, and
+flagged when one statement shape ran more than the repeat threshold (the
+usual sign of an N+1 loop) or a statement exceeded the slow threshold.
+Responses also carry a Server-Timing header with the same numbers.
+"""
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from typing import List, Tuple
+import greenlet
+from app.database import settings
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+PROJECT_DIR = os.path.dirname(APP_DIR.rstrip(os.sep))
+_SKIPPED_FILES = {os.path.abspath(__file__), os.path.join(APP_DIR, "metrics.py")}
+
+# Bind parameter markers of the supported drivers, collapsed together with the
+# commas between them so an IN list of any length has a single shape.
+_PARAMS = re.compile(r"(?:\?|\$\d+|%\(\w+\)s)(?:\s*,\s*(?:\?|\$\d+|%\(\w+\)s))*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    return _WHITESPACE.sub(" ", _PARAMS.sub("?", statement)).strip()
+
+
+def find_call_site() -> str:
+    """
+    First application frame above the cursor event. The async session runs
+    the statement in a child greenlet, so the search continues in the parent
+    greenlet's suspended frames, where the awaiting coroutines are.
+    """
+    frame = sys._getframe(1)
+    parent = greenlet.getcurrent().parent
+    while True:
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(APP_DIR) and filename not in _SKIPPED_FILES:
+                return f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+            frame = frame.f_back
+        if parent is None or parent.gr_frame is None:
+            return "unknown"
+        frame = parent.gr_frame
+        parent = parent.parent
+
+
+class QueryProfile:
+    """Statements executed during one request."""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, str, float, str]] = []  # (shape, sql, seconds, call site)
+
+    def record(self, statement: str, duration: float):
+        self.statements.append((statement_shape(statement), statement, duration, find_call_site()))
+
+    def repeated_shapes(self, threshold: int) -> List[Tuple[str, int, List[str]]]:
+        counts = Counter(shape for shape, _, _, _ in self.statements)
+        repeated = []
+        for shape, count in counts.most_common():
+            if count <= threshold:
+                break
+            call_sites = sorted({site for s, _, _, site in self.statements if s == shape})
+            repeated.append((shape, count, call_sites))
+        return repeated
+
+    def report(self, method: str, route: str, status_code: int, db_time: float):
+        slow_seconds = settings.query_profiling_slow_ms / 1000
+        repeated = self.repeated_shapes(settings.query_profiling_repeat_threshold)
+        slowest = sorted(self.statements, key=lambda s: s[2], reverse=True)[:settings.query_profiling_slowest]
+        flagged = bool(repeated) or any(duration >= slow_seconds for _, _, duration, _ in slowest)
+
+        lines = [
+            f"{method} {route} -> {status_code}: {len(self.statements)} queries, {db_time * 1000:.1f} ms in database"
+        ]
+        for shape, count, call_sites in repeated:
+            lines.append(f"  possible N+1: {count}x from {', '.join(call_sites)}: {_truncate(shape)}")
+        for _, statement, duration, call_site in slowest:
+            lines.append(f"  {duration * 1000:.1f} ms at {call_site}: {_truncate(statement)}")
+        logger.log(logging.WARNING if flagged else logging.INFO, "\n".join(lines))
+
+
+def _truncate(statement: str, length: int = 300) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return statement if len(statement) <= length else statement[:length] + "..."
+
+
+def server_timing(queries: int, db_time: float, elapsed: float) -> str:
+    return f'db;dur={db_time * 1000:.1f};desc="{queries} queries", app;dur={elapsed * 1000:.1f}'
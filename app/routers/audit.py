@@ -1,15 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import csv
+import io
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+from sqlalchemy import case, func, select, or_
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
-from datetime import datetime
-from app.database import get_db
+from datetime import date, datetime
+from app.database import get_db, settings, AsyncSessionLocal
 from app import models, schemas
-from app.auth import require_role
+from app.auth import check_role, get_user_from_token, oauth2_scheme, require_role
+from app.pagination import id_paginate, keyset_paginate, next_id_page, next_page
+from app.serialization import FastJSONResponse, response_columns, rows_as_dicts
 
 router = APIRouter(prefix="/api/audit", tags=["audit"])
 
+COMMUNICATION_RULE_COLUMNS = response_columns(models.CommunicationRule, schemas.CommunicationRuleResponse)
+MESSAGE_LOG_COLUMNS = response_columns(models.MessageLog, schemas.MessageLogResponse)
+
 
 @router.get("/communication-rules", response_model=List[schemas.CommunicationRuleResponse])
 async def audit_communication_rules(
@@ -23,7 +33,7 @@ async def audit_communication_rules(
     """
     Audit all communication rules with filters.
     """
-    query = select(models.CommunicationRule)
+    query = select(*COMMUNICATION_RULE_COLUMNS)
     
     if dept_id:
         query = query.filter(
@@ -44,13 +54,48 @@ async def audit_communication_rules(
     query = query.offset(skip).limit(limit).order_by(models.CommunicationRule.created_at.desc())
     
     result = await db.execute(query)
-    rules = result.scalars().all()
-    return rules
+    return FastJSONResponse(rows_as_dicts(result.all()))
+
+
+EXPORT_COLUMNS = ["id", "sender_id", "receiver_id", "subject", "message_content", "timestamp", "status", "reason"]
+
+
+def filter_message_logs(
+    query,
+    sender_id: Optional[int] = None,
+    receiver_id: Optional[int] = None,
+    status_filter: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """Apply the audit message log filters to a query."""
+    if sender_id:
+        query = query.filter(models.MessageLog.sender_id == sender_id)
+    
+    if receiver_id:
+        query = query.filter(models.MessageLog.receiver_id == receiver_id)
+    
+    if status_filter:
+        query = query.filter(models.MessageLog.status == status_filter)
+    
+    if start_date:
+        query = query.filter(models.MessageLog.timestamp >= start_date)
+    
+    if end_date:
+        query = query.filter(models.MessageLog.timestamp <= end_date)
+    
+    return query
 
 
-@router.get("/message-logs", response_model=List[schemas.MessageLogResponse])
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+@router.get("/message-logs", response_model=schemas.MessageLogPage)
 async def audit_message_logs(
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 100,
     sender_id: Optional[int] = None,
     receiver_id: Optional[int] = None,
@@ -62,74 +107,206 @@ async def audit_message_logs(
 ):
     """
     Comprehensive audit of all message logs with various filters.
+    Newest first; pass the returned next_cursor to fetch the following page.
     """
-    query = select(models.MessageLog)
+    query = filter_message_logs(
+        select(*MESSAGE_LOG_COLUMNS), sender_id, receiver_id, status_filter, start_date, end_date
+    )
     
-    if sender_id:
-        query = query.filter(models.MessageLog.sender_id == sender_id)
+    query = keyset_paginate(query, models.MessageLog.timestamp, models.MessageLog.id, cursor, limit)
     
-    if receiver_id:
-        query = query.filter(models.MessageLog.receiver_id == receiver_id)
+    result = await db.execute(query)
+    logs, next_cursor = next_page(result.all(), limit)
+    return FastJSONResponse({"items": rows_as_dicts(logs), "next_cursor": next_cursor})
+
+
+@router.get("/message-logs/export")
+async def export_message_logs(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    sender_id: Optional[int] = None,
+    receiver_id: Optional[int] = None,
+    status_filter: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    chunk_size: int = Query(1000, ge=1, le=10000),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Stream every message log matching the filters as NDJSON or CSV, oldest first.
+    Rows are read through a server-side cursor and written chunk by chunk,
+    so memory stays flat however large the export is.
+    """
+    # Not require_role: its get_db session would stay checked out, idle in
+    # transaction, until the whole export has been sent
+    async with AsyncSessionLocal() as db:
+        check_role(await get_user_from_token(token, db), ["admin", "auditor"])
     
-    if status_filter:
-        query = query.filter(models.MessageLog.status == status_filter)
+    columns = [getattr(models.MessageLog, name) for name in EXPORT_COLUMNS]
+    query = filter_message_logs(
+        select(*columns), sender_id, receiver_id, status_filter, start_date, end_date
+    ).order_by(models.MessageLog.timestamp, models.MessageLog.id)
+    
+    async def generate_rows():
+        # The export outlives the request's session, so it reads through its own
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(query.execution_options(yield_per=chunk_size))
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_COLUMNS)
+                yield buffer.getvalue()
+            async for partition in result.partitions():
+                if export_format == "csv":
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(
+                        [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                        for row in partition
+                    )
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(
+                        json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=_json_default) + "\n"
+                        for row in partition
+                    )
+    
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        generate_rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="message-logs.{export_format}"'}
+    )
+
+
+@router.get("/stats", response_model=List[schemas.MessageStatsResponse], response_model_exclude_none=True)
+async def message_stats(
+    group_by: str = Query("dept_pair", pattern="^(dept_pair|user|day)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    dept_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(require_role(["admin", "auditor"]))
+):
+    """
+    Sent/blocked message counts grouped by department pair, sender or day.
+    Answered from the daily rollup tables rather than the message logs.
+    dept_id applies to department groupings, user_id to the sender grouping.
+    """
+    if group_by == "user":
+        stats = models.UserMessageStatsDaily
+        group_columns = [stats.user_id]
+        query_filters = [stats.user_id == user_id] if user_id else []
+    else:
+        stats = models.MessageStatsDaily
+        group_columns = [stats.sender_dept_id, stats.receiver_dept_id] if group_by == "dept_pair" else [stats.day]
+        query_filters = [or_(stats.sender_dept_id == dept_id, stats.receiver_dept_id == dept_id)] if dept_id else []
     
     if start_date:
-        query = query.filter(models.MessageLog.timestamp >= start_date)
+        query_filters.append(stats.day >= start_date)
     
     if end_date:
-        query = query.filter(models.MessageLog.timestamp <= end_date)
+        query_filters.append(stats.day <= end_date)
     
-    query = query.offset(skip).limit(limit).order_by(models.MessageLog.timestamp.desc())
+    query = (
+        select(
+            *group_columns,
+            func.sum(case((stats.status == "sent", stats.message_count), else_=0)).label("sent"),
+            func.sum(case((stats.status == "blocked", stats.message_count), else_=0)).label("blocked"),
+            func.sum(stats.message_count).label("total")
+        )
+        .filter(*query_filters)
+        .group_by(*group_columns)
+        .order_by(*group_columns)
+    )
     
     result = await db.execute(query)
-    logs = result.scalars().all()
-    return logs
+    return [row._asdict() for row in result.all()]
+
+
+# Caps the sessions the activity report queries hold across all requests, so
+# concurrent reports queue here instead of draining the connection pool
+_activity_sessions = asyncio.Semaphore(settings.audit_activity_max_sessions)
+
+
+async def _fetch_all(query) -> list:
+    """Run a query on its own session so several can run concurrently."""
+    async with _activity_sessions, AsyncSessionLocal() as session:
+        result = await session.execute(query)
+        return list(result.scalars().all())
+
+
+async def _fetch_one(query):
+    async with _activity_sessions, AsyncSessionLocal() as session:
+        result = await session.execute(query)
+        return result.one_or_none()
+
+
+def _count(model, *criteria):
+    return select(func.count()).select_from(model).filter(*criteria).scalar_subquery()
 
 
 @router.get("/user-activity/{user_id}")
 async def audit_user_activity(
     user_id: int,
-    db: AsyncSession = Depends(get_db),
+    limit: int = Query(50, ge=1, le=500),
+    requested_cursor: Optional[str] = None,
+    approved_cursor: Optional[str] = None,
+    sent_cursor: Optional[str] = None,
+    received_cursor: Optional[str] = None,
     current_user: models.User = Depends(require_role(["admin", "auditor"]))
 ):
     """
-    Get comprehensive activity log for a specific user.
+    Get an activity report for a specific user.
+    Counts are computed with SQL aggregates. Each detail list returns at most
+    `limit` entries, newest first, with a cursor for the next page.
+    The independent queries run concurrently, at most
+    AUDIT_ACTIVITY_MAX_SESSIONS at a time across all reports.
     """
-    from sqlalchemy.orm import selectinload
+    rule = models.CommunicationRule
+    message = models.MessageLog
     
-    user_result = await db.execute(
+    user_query = (
         select(models.User)
         .filter(models.User.id == user_id)
         .options(selectinload(models.User.role), selectinload(models.User.department))
     )
-    user = user_result.scalar_one_or_none()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get all rules requested by user
-    requested_rules_result = await db.execute(
-        select(models.CommunicationRule).filter(models.CommunicationRule.requester_id == user_id)
+    counts_query = select(
+        _count(message, message.sender_id == user_id).label("sent_messages_count"),
+        _count(message, message.receiver_id == user_id).label("received_messages_count"),
+        _count(message, message.sender_id == user_id, message.status == "blocked").label("blocked_messages_count"),
+        _count(rule, rule.requester_id == user_id).label("requested_rules_count"),
+        _count(rule, rule.approved_by_id == user_id).label("approved_rules_count"),
     )
-    requested_rules = requested_rules_result.scalars().all()
-    
-    # Get all rules approved by user
-    approved_rules_result = await db.execute(
-        select(models.CommunicationRule).filter(models.CommunicationRule.approved_by_id == user_id)
+    requested_query = keyset_paginate(
+        select(rule).filter(rule.requester_id == user_id), rule.created_at, rule.id, requested_cursor, limit
     )
-    approved_rules = approved_rules_result.scalars().all()
-    
-    # Get all messages sent by user
-    sent_messages_result = await db.execute(
-        select(models.MessageLog).filter(models.MessageLog.sender_id == user_id)
+    approved_query = keyset_paginate(
+        select(rule).filter(rule.approved_by_id == user_id), rule.created_at, rule.id, approved_cursor, limit
+    )
+    sent_query = id_paginate(
+        select(message).filter(message.sender_id == user_id), message.id, sent_cursor, limit
+    )
+    received_query = id_paginate(
+        select(message).filter(message.receiver_id == user_id), message.id, received_cursor, limit
     )
-    sent_messages = sent_messages_result.scalars().all()
     
-    # Get all messages received by user
-    received_messages_result = await db.execute(
-        select(models.MessageLog).filter(models.MessageLog.receiver_id == user_id)
+    users, counts, requested_rows, approved_rows, sent_rows, received_rows = await asyncio.gather(
+        _fetch_all(user_query),
+        _fetch_one(counts_query),
+        _fetch_all(requested_query),
+        _fetch_all(approved_query),
+        _fetch_all(sent_query),
+        _fetch_all(received_query),
     )
-    received_messages = received_messages_result.scalars().all()
+    if not users:
+        raise HTTPException(status_code=404, detail="User not found")
+    user = users[0]
+    
+    requested_rules, requested_next = next_page(requested_rows, limit, "created_at")
+    approved_rules, approved_next = next_page(approved_rows, limit, "created_at")
+    sent_messages, sent_next = next_id_page(sent_rows, limit)
+    received_messages, received_next = next_id_page(received_rows, limit)
     
     return {
         "user": {
@@ -139,11 +316,13 @@ async def audit_user_activity(
             "department": user.department.name,
             "role": user.role.name
         },
+        **counts._asdict(),
         "requested_rules": [schemas.CommunicationRuleResponse.model_validate(r) for r in requested_rules],
+        "requested_rules_next_cursor": requested_next,
         "approved_rules": [schemas.CommunicationRuleResponse.model_validate(r) for r in approved_rules],
-        "sent_messages_count": len(list(sent_messages)),
-        "received_messages_count": len(list(received_messages)),
+        "approved_rules_next_cursor": approved_next,
         "sent_messages": [schemas.MessageLogResponse.model_validate(m) for m in sent_messages],
-        "received_messages": [schemas.MessageLogResponse.model_validate(m) for m in received_messages]
+        "sent_messages_next_cursor": sent_next,
+        "received_messages": [schemas.MessageLogResponse.model_validate(m) for m in received_messages],
+        "received_messages_next_cursor": received_next
     }
-
@@ -6,7 +6,9 @@ from sqlalchemy import select, update
 from pydantic import BaseModel
 from app.database import get_db, settings
 from app import models, schemas
-from app.auth import authenticate_user, create_access_token, get_current_active_user, get_password_hash, verify_password
+from app.auth import authenticate_user, create_access_token, get_current_active_user, get_password_hash_async, verify_password_async, require_role
+from app.principal_cache import principal_cache
+from app.password_hasher import password_hashing_pool
 from app.password_validator import validate_password_strength
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
@@ -48,8 +50,11 @@ async def change_password(
     Allow logged-in users to change their password.
     Requires current password verification and new password meeting strength requirements.
     """
-    # Verify current password is correct
-    if not verify_password(password_change.current_password, str(current_user.password_hash)):
+    # Verify current password is correct, against the stored hash: the
+    # principal may come from the cache, which does not carry it
+    result = await db.execute(select(models.User.password_hash).filter(models.User.id == current_user.id))
+    password_hash = result.scalar_one_or_none()
+    if password_hash is None or not await verify_password_async(password_change.current_password, password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Current password is incorrect"
@@ -71,12 +76,14 @@ async def change_password(
         )
     
     # Update password in database
+    new_password_hash = await get_password_hash_async(password_change.new_password)
     await db.execute(
         update(models.User)
         .where(models.User.id == current_user.id)
-        .values(password_hash=get_password_hash(password_change.new_password))
+        .values(password_hash=new_password_hash)
     )
     await db.commit()
+    principal_cache.invalidate(current_user.email)
     
     return {
         "message": "Password changed successfully",
@@ -85,3 +92,17 @@ async def change_password(
     }
 
 
+@router.get("/principal-cache", response_model=dict)
+async def principal_cache_stats(current_user: models.User = Depends(require_role(["admin"]))):
+    """
+    Hit/miss counters for the authenticated principal cache, for sizing it.
+    """
+    return principal_cache.stats()
+
+
+@router.get("/password-hashing", response_model=dict)
+async def password_hashing_stats(current_user: models.User = Depends(require_role(["admin"]))):
+    """
+    Queue wait and hash time figures for the password hashing pool.
+    """
+    return password_hashing_pool.stats()
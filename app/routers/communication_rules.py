@@ -6,6 +6,10 @@ from typing import List, Optional
 from app.database import get_db
 from app import models, schemas
 from app.auth import get_current_active_user, require_role
+from app.http_cache import bump
+from app.permission_graph import RULES_VERSION, permission_graph
+from app.permissions import dept_pair_filter
+from app.rule_expiry import rule_expiry_scheduler
 
 router = APIRouter(prefix="/api/communication-rules", tags=["communication-rules"])
 
@@ -34,16 +38,15 @@ async def create_permanent_rule(
     if rule.dept_a_id == rule.dept_b_id:
         raise HTTPException(status_code=400, detail="Cannot create rule for same department")
     
-    # Check if rule already exists
+    # Check if rule already exists (in either direction)
     existing_result = await db.execute(
-        select(models.CommunicationRule).filter(
+        select(models.CommunicationRule.id).filter(
             and_(
-                models.CommunicationRule.dept_a_id == rule.dept_a_id,
-                models.CommunicationRule.dept_b_id == rule.dept_b_id,
+                dept_pair_filter(rule.dept_a_id, rule.dept_b_id),
                 models.CommunicationRule.rule_type == "permanent",
                 models.CommunicationRule.is_active == True
             )
-        )
+        ).limit(1)
     )
     existing = existing_result.scalar_one_or_none()
     
@@ -60,8 +63,10 @@ async def create_permanent_rule(
         expiry_timestamp=None
     )
     db.add(db_rule)
+    version = await bump(db, RULES_VERSION)
     await db.commit()
     await db.refresh(db_rule)
+    permission_graph.apply_rule(db_rule, version)
     return db_rule
 
 
@@ -202,11 +207,14 @@ async def approve_rule(
             )
         )
     
+    version = await bump(db, RULES_VERSION)
     await db.commit()
     
     # Refresh the rule to return updated data
     result = await db.execute(select(models.CommunicationRule).filter(models.CommunicationRule.id == approval.rule_id))
     db_rule = result.scalar_one_or_none()
+    permission_graph.apply_rule(db_rule, version)
+    rule_expiry_scheduler.schedule_rule(db_rule)
     return db_rule
 
 
@@ -257,6 +265,9 @@ async def delete_rule(
         raise HTTPException(status_code=404, detail="Rule not found")
     
     await db.execute(delete(models.CommunicationRule).filter(models.CommunicationRule.id == rule_id))
+    version = await bump(db, RULES_VERSION)
     await db.commit()
+    permission_graph.remove_rule(rule_id, version)
+    rule_expiry_scheduler.unschedule(rule_id)
     return None
 
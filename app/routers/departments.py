@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import List, Optional
 from app.database import get_db
 from app import models, schemas
 from app.auth import get_current_active_user, require_role
+from app.http_cache import bump, reference_cache
 
 router = APIRouter(prefix="/api/departments", tags=["departments"])
 
+DEPARTMENT_LIST = TypeAdapter(List[schemas.DepartmentResponse])
+DEPARTMENT = TypeAdapter(schemas.DepartmentResponse)
+
 
 @router.post("/", response_model=schemas.DepartmentResponse, status_code=status.HTTP_201_CREATED)
 async def create_department(
@@ -22,8 +27,10 @@ async def create_department(
     
     db_dept = models.Department(name=department.name)
     db.add(db_dept)
+    await bump(db, "departments")
     await db.commit()
     await db.refresh(db_dept)
+    reference_cache.invalidate("departments")
     return db_dept
 
 
@@ -31,23 +38,29 @@ async def create_department(
 async def read_departments(
     skip: int = 0,
     limit: int = 100,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    result = await db.execute(select(models.Department).offset(skip).limit(limit))
-    departments = result.scalars().all()
-    return departments
+    """Served from the reference cache; revalidate with If-None-Match."""
+    async def load():
+        result = await db.execute(select(models.Department).offset(skip).limit(limit))
+        return result.scalars().all()
+    return await reference_cache.respond(db, "departments", ("list", skip, limit), if_none_match, load, DEPARTMENT_LIST)
 
 
 @router.get("/{dept_id}", response_model=schemas.DepartmentResponse)
 async def read_department(
     dept_id: int,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    result = await db.execute(select(models.Department).filter(models.Department.id == dept_id))
-    db_dept = result.scalar_one_or_none()
-    if db_dept is None:
-        raise HTTPException(status_code=404, detail="Department not found")
-    return db_dept
-
+    """Served from the reference cache; revalidate with If-None-Match."""
+    async def load():
+        result = await db.execute(select(models.Department).filter(models.Department.id == dept_id))
+        db_dept = result.scalar_one_or_none()
+        if db_dept is None:
+            raise HTTPException(status_code=404, detail="Department not found")
+        return db_dept
+    return await reference_cache.respond(db, "departments", dept_id, if_none_match, load, DEPARTMENT)
@@ -1,17 +1,44 @@
+import json
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List, Optional
-from app.database import get_db, settings
+from sqlalchemy import insert, select
+from typing import AsyncIterator, List, Optional
+from app.database import AsyncSessionLocal, get_db, settings
 from app import models, schemas
-from app.auth import get_current_active_user, require_role
-from app.permissions import check_communication_permission
-# Email functionality disabled - commented out for future updates
-# from app.email_service import send_email
+from app.auth import (
+    STREAM_TICKET_PURPOSE, create_stream_ticket, get_current_active_user, get_user_from_token,
+    optional_oauth2_scheme, require_role
+)
+from app.permissions import check_communication_permission, check_communication_permissions
+from app.permission_graph import permission_graph
+from app.pagination import id_paginate, keyset_paginate, next_id_page, next_page
+from app.message_stats import record_messages, today
+from app.mailbox import bump_mailboxes, mailbox_etag, mailbox_version
+from app.http_cache import etag_matches
+from app.outbox import MESSAGE_SENT, outbox_dispatcher
+from app.pubsub import inbox_channel, pubsub
+from app.serialization import FastJSONResponse, response_columns, rows_as_dicts
 
 router = APIRouter(prefix="/api/messages", tags=["messages"])
 
+MESSAGE_LOG_COLUMNS = response_columns(models.MessageLog, schemas.MessageLogResponse)
+
+
+def _message_sent_payload(message_id: int, sender_id: int, receiver_id: int, subject: Optional[str], message_content: Optional[str]) -> dict:
+    return {
+        "message_id": message_id,
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "subject": subject,
+        "message_content": message_content,
+    }
+
+
+def _inbox_event(message: schemas.MessageLogResponse) -> dict:
+    return {"id": message.id, "type": "message", "data": message.model_dump(mode="json")}
+
 
 @router.post("/send", response_model=schemas.MessageLogResponse, status_code=status.HTTP_201_CREATED)
 async def send_message(
@@ -22,7 +49,8 @@ async def send_message(
     """
     Send a message. The system will check permissions before allowing.
     Messages are stored in the database (MessageLog table).
-    Email functionality is currently disabled (commented out for future updates).
+    Side effects (email, webhooks) are recorded as outbox events in the same
+    transaction and delivered in the background by the outbox dispatcher.
     """
     # Check if receiver exists
     receiver_result = await db.execute(select(models.User).filter(models.User.id == message.receiver_id))
@@ -38,6 +66,9 @@ async def send_message(
         db, current_user.id, message.receiver_id
     )
     
+    # Before the insert, see app.mailbox
+    await bump_mailboxes(db, received_user_ids=[message.receiver_id], sent_user_ids=[current_user.id])
+    
     # Create message log
     db_message = models.MessageLog(
         sender_id=current_user.id,
@@ -45,11 +76,24 @@ async def send_message(
         subject=message.subject,
         message_content=message.message_content,
         status="sent" if is_allowed else "blocked",
-        reason=reason if not is_allowed else None
+        reason=reason if not is_allowed else None,
+        email_status="pending" if is_allowed and outbox_dispatcher.has_sink("email") else None
     )
     db.add(db_message)
+    enqueued = 0
+    if is_allowed:
+        await db.flush()
+        enqueued = await outbox_dispatcher.enqueue(db, MESSAGE_SENT, [
+            _message_sent_payload(db_message.id, current_user.id, message.receiver_id, message.subject, message.message_content)
+        ])
+    await record_messages(db, [
+        (today(), current_user.id, current_user.dept_id, receiver.dept_id, db_message.status)
+    ])
     await db.commit()
     await db.refresh(db_message)
+    await pubsub.publish(
+        inbox_channel(message.receiver_id), _inbox_event(schemas.MessageLogResponse.model_validate(db_message))
+    )
     
     # HOW MESSAGES ARE SENT:
     # Messages are "sent" by creating a record in the MessageLog table in the database.
@@ -66,77 +110,309 @@ async def send_message(
             detail=f"Message blocked: {reason}. Please request access first."
         )
     
-    # Email functionality disabled - commented out for future updates
-    # Messages are currently only stored in the database (MessageLog table)
-    # To re-enable email functionality:
-    # 1. Uncomment the import: from app.email_service import send_email
-    # 2. Uncomment the code below
-    # 3. Set ENABLE_EMAIL=True in .env file
-    # 4. Configure SMTP settings in .env file
-    #
-    # # Send email if enabled and message was allowed
-    # if settings.enable_email and is_allowed:
-    #     email_sent = await send_email(
-    #         recipient_email=receiver.email,
-    #         subject=message.subject or f"Message from {current_user.name}",
-    #         body=message.message_content,
-    #         sender_name=current_user.name,
-    #         sender_email=current_user.email
-    #     )
-    #     # Update message log with email status if needed
-    #     if not email_sent:
-    #         # Log email failure but don't fail the request
-    #         db_message.reason = f"{db_message.reason or ''} | Email delivery failed".strip()
-    #         await db.commit()
+    if enqueued:
+        outbox_dispatcher.notify()
     
     return db_message
 
 
-@router.get("/sent", response_model=List[schemas.MessageLogResponse])
+@router.post("/send-bulk", response_model=schemas.BroadcastResponse, status_code=status.HTTP_201_CREATED)
+async def send_bulk_message(
+    message: schemas.MessageBroadcast,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Send one message to many receivers.
+    Permissions are evaluated for all receivers together and every MessageLog
+    row, sent or blocked, is written with a single INSERT in one transaction.
+    Blocked receivers do not fail the call; each one gets its own result.
+    """
+    receiver_ids = list(dict.fromkeys(message.receiver_ids))
+    if len(receiver_ids) > settings.max_broadcast_recipients:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot send to more than {settings.max_broadcast_recipients} receivers at once"
+        )
+    
+    permissions = await check_communication_permissions(db, current_user.id, receiver_ids)
+    
+    results = {}
+    rows = []
+    for receiver_id, (is_allowed, reason) in permissions.items():
+        if receiver_id == current_user.id:
+            results[receiver_id] = schemas.BroadcastResult(
+                receiver_id=receiver_id, status="rejected", reason="Cannot send message to yourself"
+            )
+        elif permission_graph.get_user_department(receiver_id) is None:
+            results[receiver_id] = schemas.BroadcastResult(
+                receiver_id=receiver_id, status="rejected", reason="Receiver not found"
+            )
+        else:
+            rows.append({
+                "sender_id": current_user.id,
+                "receiver_id": receiver_id,
+                "subject": message.subject,
+                "message_content": message.message_content,
+                "status": "sent" if is_allowed else "blocked",
+                "reason": reason if not is_allowed else None,
+                "email_status": "pending" if is_allowed and outbox_dispatcher.has_sink("email") else None
+            })
+    
+    if rows:
+        # Before the insert, see app.mailbox
+        await bump_mailboxes(
+            db, received_user_ids=[row["receiver_id"] for row in rows], sent_user_ids=[current_user.id] * len(rows)
+        )
+        inserted = await db.execute(
+            insert(models.MessageLog).returning(
+                models.MessageLog.id, models.MessageLog.receiver_id, models.MessageLog.timestamp,
+                sort_by_parameter_order=True
+            ),
+            rows
+        )
+        logged = []
+        for (message_id, receiver_id, timestamp), row in zip(inserted.all(), rows):
+            results[receiver_id] = schemas.BroadcastResult(
+                receiver_id=receiver_id, status=row["status"], reason=row["reason"], message_id=message_id
+            )
+            logged.append(schemas.MessageLogResponse(id=message_id, timestamp=timestamp, **row))
+        enqueued = await outbox_dispatcher.enqueue(db, MESSAGE_SENT, [
+            _message_sent_payload(result.message_id, current_user.id, result.receiver_id, message.subject, message.message_content)
+            for result in results.values() if result.status == "sent"
+        ])
+        day = today()
+        await record_messages(db, [
+            (day, current_user.id, current_user.dept_id,
+             permission_graph.get_user_department(row["receiver_id"]), row["status"])
+            for row in rows
+        ])
+        await db.commit()
+        if enqueued:
+            outbox_dispatcher.notify()
+        await pubsub.publish_many(
+            (inbox_channel(logged_message.receiver_id), _inbox_event(logged_message)) for logged_message in logged
+        )
+    
+    ordered = [results[receiver_id] for receiver_id in receiver_ids]
+    return schemas.BroadcastResponse(
+        sent_count=sum(1 for r in ordered if r.status == "sent"),
+        blocked_count=sum(1 for r in ordered if r.status == "blocked"),
+        rejected_count=sum(1 for r in ordered if r.status == "rejected"),
+        results=ordered
+    )
+
+
+@router.post("/check-permissions", response_model=List[schemas.PermissionCheckResult])
+async def check_message_permissions(
+    request: schemas.PermissionCheckRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Check whether the current user may message each of the given receivers.
+    All receivers are evaluated together, so the cost does not grow with the list.
+    """
+    receiver_ids = list(dict.fromkeys(request.receiver_ids))
+    results = await check_communication_permissions(db, current_user.id, receiver_ids)
+    return [
+        schemas.PermissionCheckResult(receiver_id=receiver_id, allowed=allowed, reason=reason)
+        for receiver_id, (allowed, reason) in results.items()
+    ]
+
+
+@router.get("/sent", response_model=schemas.MessageLogPage)
 async def get_sent_messages(
-    skip: int = 0,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
     limit: int = 100,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get messages sent by current user.
+    Get messages sent by current user, newest first.
+    Pass the returned next_cursor to fetch the following page, or since_id
+    to fetch only messages newer than that id (see _list_mailbox).
     """
-    result = await db.execute(
-        select(models.MessageLog)
-        .filter(models.MessageLog.sender_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .order_by(models.MessageLog.timestamp.desc())
+    return await _list_mailbox(
+        db, current_user.id, models.MessageLog.sender_id, models.UserMailbox.sent_version,
+        cursor, since_id, limit, if_none_match
     )
-    messages = result.scalars().all()
-    return messages
 
 
-@router.get("/received", response_model=List[schemas.MessageLogResponse])
+@router.get("/received", response_model=schemas.MessageLogPage)
 async def get_received_messages(
-    skip: int = 0,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
     limit: int = 100,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get messages received by current user.
+    Get messages received by current user, newest first.
+    Pass the returned next_cursor to fetch the following page, or since_id
+    to fetch only messages newer than that id (see _list_mailbox).
+    """
+    return await _list_mailbox(
+        db, current_user.id, models.MessageLog.receiver_id, models.UserMailbox.received_version,
+        cursor, since_id, limit, if_none_match
+    )
+
+
+async def _list_mailbox(
+    db: AsyncSession,
+    user_id: int,
+    owner_column,
+    version_column,
+    cursor: Optional[str],
+    since_id: Optional[int],
+    limit: int,
+    if_none_match: Optional[str]
+):
+    """
+    A page of the user's sent or received messages, tagged with the mailbox
+    version. If-None-Match with the current tag gets 304 without running the
+    listing query.
+
+    With since_id the page holds the messages with a greater id, oldest first;
+    repeat with the returned next_since_id until fewer than limit come back.
+    Without it the page is newest first by id, and the first page returns
+    the next_since_id to start delta syncing from. Both use the
+    (owner, id) index.
+    """
+    # Read the version before listing: a message logged in between bumps it,
+    # so this tag can only be older than the page, never newer
+    etag = mailbox_etag(user_id, await mailbox_version(db, user_id, version_column))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    query = select(*MESSAGE_LOG_COLUMNS).filter(owner_column == user_id)
+    if since_id is not None:
+        query = query.filter(models.MessageLog.id > since_id).order_by(models.MessageLog.id).limit(limit)
+        result = await db.execute(query)
+        messages = result.all()
+        return FastJSONResponse({
+            "items": rows_as_dicts(messages),
+            "next_cursor": None,
+            "next_since_id": messages[-1].id if messages else since_id
+        }, headers=headers)
+    
+    query = id_paginate(query, models.MessageLog.id, cursor, limit)
+    result = await db.execute(query)
+    messages, next_cursor = next_id_page(result.all(), limit)
+    next_since_id = None
+    if cursor is None:
+        next_since_id = max((message.id for message in messages), default=0)
+    return FastJSONResponse({
+        "items": rows_as_dicts(messages),
+        "next_cursor": next_cursor,
+        "next_since_id": next_since_id
+    }, headers=headers)
+
+
+@router.post("/stream-ticket", response_model=schemas.StreamTicket)
+async def create_inbox_stream_ticket(current_user: models.User = Depends(get_current_active_user)):
+    """
+    Issue a short-lived ticket for ?ticket= on /stream. It can open the
+    stream and nothing else, so the access token never goes in a URL.
+    """
+    return {
+        "ticket": create_stream_ticket(current_user.email),
+        "expires_in": settings.stream_ticket_expire_seconds
+    }
+
+
+@router.get("/stream")
+async def stream_received_messages(
+    ticket: Optional[str] = None,
+    bearer_token: Optional[str] = Depends(optional_oauth2_scheme),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Server-Sent Events stream of messages received by the current user,
+    pushed as they are sent, instead of polling /received. An open stream
+    runs no queries; it only sends a keepalive comment now and then.
+    Authenticate with the Authorization header, or, for EventSource clients
+    that cannot set headers, ?ticket= from POST /stream-ticket. On
+    reconnect, messages after Last-Event-ID are replayed first; if more were
+    missed than INBOX_STREAM_REPLAY_LIMIT a "resync" event asks the client to
+    reload /received instead.
     """
-    result = await db.execute(
-        select(models.MessageLog)
-        .filter(models.MessageLog.receiver_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .order_by(models.MessageLog.timestamp.desc())
+    if not (bearer_token or ticket):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Not Depends(get_db): the session would stay checked out for the whole stream
+    async with AsyncSessionLocal() as db:
+        if bearer_token:
+            current_user = await get_user_from_token(bearer_token, db)
+        else:
+            current_user = await get_user_from_token(ticket, db, purpose=STREAM_TICKET_PURPOSE)
+    after_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    return StreamingResponse(
+        _inbox_events(current_user.id, after_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    messages = result.scalars().all()
-    return messages
 
 
-@router.get("/logs", response_model=List[schemas.MessageLogResponse])
+def _sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+async def _inbox_events(user_id: int, after_id: Optional[int]) -> AsyncIterator[str]:
+    async with pubsub.subscribe(inbox_channel(user_id)) as subscription:
+        # Subscribe before replaying so nothing sent in between is missed;
+        # live events that were also replayed are skipped by id.
+        replayed = set()
+        if after_id is not None:
+            limit = settings.inbox_stream_replay_limit
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(models.MessageLog)
+                    .filter(models.MessageLog.receiver_id == user_id, models.MessageLog.id > after_id)
+                    .order_by(models.MessageLog.id)
+                    .limit(limit + 1)
+                )
+                missed = result.scalars().all()
+            replayed = {missed_message.id for missed_message in missed}
+            if len(missed) > limit:
+                yield "event: resync\ndata: {}\n\n"
+            else:
+                for missed_message in missed:
+                    yield _sse(_inbox_event(schemas.MessageLogResponse.model_validate(missed_message)))
+        yield ": connected\n\n"
+
+        while not (subscription.overflowed and subscription.queue.empty()):
+            event = await subscription.get(timeout=settings.inbox_stream_keepalive_seconds)
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            if event["id"] in replayed:
+                continue
+            if event.get("truncated"):
+                # Too large for the pub/sub backend; load it
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(
+                        select(models.MessageLog)
+                        .filter(models.MessageLog.id == event["id"], models.MessageLog.receiver_id == user_id)
+                    )
+                    truncated_message = result.scalar_one_or_none()
+                if truncated_message is None:
+                    continue
+                event = _inbox_event(schemas.MessageLogResponse.model_validate(truncated_message))
+            yield _sse(event)
+        # Dropped for falling behind: end the stream, the client reconnects with Last-Event-ID
+
+
+@router.get("/logs", response_model=schemas.MessageLogPage)
 async def get_all_message_logs(
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 100,
     sender_id: Optional[int] = None,
     receiver_id: Optional[int] = None,
@@ -147,7 +423,7 @@ async def get_all_message_logs(
     """
     Admins and auditors can view all message logs with filters.
     """
-    query = select(models.MessageLog)
+    query = select(*MESSAGE_LOG_COLUMNS)
     
     if sender_id:
         query = query.filter(models.MessageLog.sender_id == sender_id)
@@ -158,8 +434,8 @@ async def get_all_message_logs(
     if status_filter:
         query = query.filter(models.MessageLog.status == status_filter)
     
-    query = query.offset(skip).limit(limit).order_by(models.MessageLog.timestamp.desc())
+    query = keyset_paginate(query, models.MessageLog.timestamp, models.MessageLog.id, cursor, limit)
     
     result = await db.execute(query)
-    messages = result.scalars().all()
-    return messages
+    messages, next_cursor = next_page(result.all(), limit)
+    return FastJSONResponse({"items": rows_as_dicts(messages), "next_cursor": next_cursor})
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import List, Optional
 from app.database import get_db
 from app import models, schemas
 from app.auth import get_current_active_user, require_role
+from app.http_cache import bump, reference_cache
 
 router = APIRouter(prefix="/api/roles", tags=["roles"])
 
+ROLE_LIST = TypeAdapter(List[schemas.RoleResponse])
+ROLE = TypeAdapter(schemas.RoleResponse)
+
 
 @router.post("/", response_model=schemas.RoleResponse, status_code=status.HTTP_201_CREATED)
 async def create_role(
@@ -22,8 +27,10 @@ async def create_role(
     
     db_role = models.Role(name=role.name)
     db.add(db_role)
+    await bump(db, "roles")
     await db.commit()
     await db.refresh(db_role)
+    reference_cache.invalidate("roles")
     return db_role
 
 
@@ -31,23 +38,29 @@ async def create_role(
 async def read_roles(
     skip: int = 0,
     limit: int = 100,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    result = await db.execute(select(models.Role).offset(skip).limit(limit))
-    roles = result.scalars().all()
-    return roles
+    """Served from the reference cache; revalidate with If-None-Match."""
+    async def load():
+        result = await db.execute(select(models.Role).offset(skip).limit(limit))
+        return result.scalars().all()
+    return await reference_cache.respond(db, "roles", ("list", skip, limit), if_none_match, load, ROLE_LIST)
 
 
 @router.get("/{role_id}", response_model=schemas.RoleResponse)
 async def read_role(
     role_id: int,
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    result = await db.execute(select(models.Role).filter(models.Role.id == role_id))
-    db_role = result.scalar_one_or_none()
-    if db_role is None:
-        raise HTTPException(status_code=404, detail="Role not found")
-    return db_role
-
+    """Served from the reference cache; revalidate with If-None-Match."""
+    async def load():
+        result = await db.execute(select(models.Role).filter(models.Role.id == role_id))
+        db_role = result.scalar_one_or_none()
+        if db_role is None:
+            raise HTTPException(status_code=404, detail="Role not found")
+        return db_role
+    return await reference_cache.respond(db, "roles", role_id, if_none_match, load, ROLE)
@@ -1,14 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import or_, select
+from sqlalchemy import select
 from typing import List, Optional
 from app.database import get_db
 from app import models, schemas
-from app.auth import get_current_active_user, require_role, get_password_hash
-from app.permissions import get_communicable_users
+from app.auth import get_current_active_user, require_role, get_password_hash_async
+from app.permissions import communicable_users_filter
+from app.permission_graph import permission_graph
+from app.principal_cache import principal_cache
+from app.serialization import FastJSONResponse, response_columns, rows_as_dicts
+from app.user_search import search_filter, search_rank
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
+USER_COLUMNS = response_columns(models.User, schemas.UserResponse)
+
 
 @router.post("/", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(
@@ -34,7 +40,7 @@ async def create_user(
     if not role:
         raise HTTPException(status_code=404, detail="Role not found")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = models.User(
         name=user.name,
         email=user.email,
@@ -45,6 +51,8 @@ async def create_user(
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    permission_graph.set_user_department(db_user.id, db_user.dept_id)
+    principal_cache.invalidate(db_user.email)
     return db_user
 
 
@@ -55,9 +63,8 @@ async def read_users(
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(require_role(["admin", "auditor"]))
 ):
-    result = await db.execute(select(models.User).offset(skip).limit(limit))
-    users = result.scalars().all()
-    return users
+    result = await db.execute(select(*USER_COLUMNS).offset(skip).limit(limit))
+    return FastJSONResponse(rows_as_dicts(result.all()))
 
 
 @router.get("/search", response_model=List[schemas.UserResponse])
@@ -73,41 +80,24 @@ async def search_communicable_users(
     Search for users that the current user can send messages to.
     Only returns users based on communication rules and permissions.
     Can filter by search query (name/email) and department.
+    Permissions, search and pagination run as a single statement.
     """
-    # Get all users the current user can communicate with
-    communicable_users = await get_communicable_users(db, current_user.id)
-    
-    if not communicable_users:
-        return []
-    
-    # Extract user IDs
-    communicable_user_ids = [user.id for user in communicable_users]
+    # Start from the users the current user can communicate with
+    query = select(*USER_COLUMNS).filter(communicable_users_filter(current_user.id))
     
-    # Build query starting with communicable users
-    query = select(models.User).filter(
-        models.User.id.in_(communicable_user_ids)
-    )
-    
-    # Apply search filter (name or email)
+    # Apply search filter (name or email), best matches first
     if q:
-        query = query.filter(
-            or_(
-                models.User.name.ilike(f"%{q}%"),
-                models.User.email.ilike(f"%{q}%")
-            )
-        )
+        query = query.filter(search_filter(db.get_bind().dialect.name, q)).order_by(search_rank(q))
     
     # Apply department filter
     if dept_id:
         query = query.filter(models.User.dept_id == dept_id)
     
     # Apply pagination
-    query = query.offset(skip).limit(limit)
+    query = query.order_by(models.User.name, models.User.id).offset(skip).limit(limit)
     
     result = await db.execute(query)
-    users = result.scalars().all()
-    
-    return users
+    return FastJSONResponse(rows_as_dicts(result.all()))
 
 
 @router.get("/{user_id}", response_model=schemas.UserResponse)
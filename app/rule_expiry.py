@@ -0,0 +1,165 @@
+"""
+Expiry scheduler for temporary communication rules.
+
+Keeps a min-heap of (expiry_timestamp, rule_id) for every active rule that
+can lapse, sleeps until the earliest one is due, then flips the due rules
+to inactive in batches and evicts them from the permission graph.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update
+from app import models
+from app.database import AsyncSessionLocal
+from app.http_cache import bump
+from app.permission_graph import RULES_VERSION, permission_graph
+
+logger = logging.getLogger(__name__)
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class RuleExpiryScheduler:
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+        self._heap: List[Tuple[datetime, int]] = []
+        # rule_id -> expiry currently scheduled; heap entries that disagree are stale
+        self._scheduled: Dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    def schedule(self, rule_id: int, expiry: Optional[datetime]):
+        """Schedule (or reschedule) a rule to be deactivated at its expiry."""
+        if expiry is None:
+            self.unschedule(rule_id)
+            return
+        expiry = _as_utc(expiry)
+        if self._scheduled.get(rule_id) == expiry:
+            return
+        self._scheduled[rule_id] = expiry
+        heapq.heappush(self._heap, (expiry, rule_id))
+        if self._heap[0] == (expiry, rule_id):
+            self._wakeup.set()
+
+    def schedule_rule(self, rule: models.CommunicationRule):
+        """Track a rule according to its current state."""
+        if rule.is_active and rule.rule_type == "temporary":
+            self.schedule(rule.id, rule.expiry_timestamp)
+        else:
+            self.unschedule(rule.id)
+
+    def unschedule(self, rule_id: int):
+        # The heap entry is left behind and skipped when it surfaces
+        self._scheduled.pop(rule_id, None)
+
+    def next_expiry(self) -> Optional[datetime]:
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _discard_stale(self):
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        self._discard_stale()
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            _, rule_id = heapq.heappop(self._heap)
+            del self._scheduled[rule_id]
+            due.append(rule_id)
+            self._discard_stale()
+        return due
+
+    async def load(self):
+        """Rebuild the schedule from every active temporary rule that has an expiry."""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(models.CommunicationRule.id, models.CommunicationRule.expiry_timestamp).filter(
+                    models.CommunicationRule.is_active == True,
+                    models.CommunicationRule.rule_type == "temporary",
+                    models.CommunicationRule.expiry_timestamp != None
+                )
+            )
+            rows = result.all()
+        self._heap = []
+        self._scheduled = {}
+        for rule_id, expiry in rows:
+            self.schedule(rule_id, expiry)
+        self._wakeup.set()
+        logger.info(f"Scheduled expiry for {len(rows)} temporary rules")
+
+    async def expire_due(self, now: Optional[datetime] = None) -> int:
+        """Deactivate every rule whose expiry has passed. Returns the number of rules processed."""
+        now = now or datetime.now(timezone.utc)
+        processed = 0
+        while True:
+            due = self._pop_due(now)
+            if not due:
+                return processed
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(models.CommunicationRule)
+                        .where(
+                            models.CommunicationRule.id.in_(due),
+                            models.CommunicationRule.is_active == True,
+                            models.CommunicationRule.expiry_timestamp <= now
+                        )
+                        .values(is_active=False)
+                        .execution_options(synchronize_session=False)
+                    )
+                    version = await bump(db, RULES_VERSION)
+                    await db.commit()
+            except Exception:
+                # Put the batch back so the next pass retries it
+                for rule_id in due:
+                    self.schedule(rule_id, now)
+                raise
+            for rule_id in due:
+                permission_graph.remove_rule(rule_id, version)
+            processed += len(due)
+
+    async def run(self, retry_seconds: float = 5.0):
+        while True:
+            self._wakeup.clear()
+            next_expiry = self.next_expiry()
+            timeout = None
+            if next_expiry is not None:
+                timeout = max(0.0, (next_expiry - datetime.now(timezone.utc)).total_seconds())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                expired = await self.expire_due()
+                if expired:
+                    logger.info(f"Deactivated {expired} expired temporary rules")
+            except Exception as e:
+                logger.error(f"Failed to deactivate expired rules: {str(e)}")
+                await asyncio.sleep(retry_seconds)
+
+    async def start(self):
+        await self.load()
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+rule_expiry_scheduler = RuleExpiryScheduler()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 
 # User Schemas
@@ -103,12 +103,46 @@ class CommunicationRuleApproval(BaseModel):
 
 
 # Message Schemas
+# A subject becomes an email header, so it may not span lines
+SUBJECT_PATTERN = r"^[^\r\n]*$"
+
+
 class MessageSend(BaseModel):
     receiver_id: int
-    subject: Optional[str] = None
+    subject: Optional[str] = Field(None, pattern=SUBJECT_PATTERN)
+    message_content: str
+
+
+class MessageBroadcast(BaseModel):
+    receiver_ids: List[int] = Field(..., min_length=1)
+    subject: Optional[str] = Field(None, pattern=SUBJECT_PATTERN)
     message_content: str
 
 
+class BroadcastResult(BaseModel):
+    receiver_id: int
+    status: str  # 'sent', 'blocked' or 'rejected' (not logged)
+    reason: Optional[str] = None
+    message_id: Optional[int] = None
+
+
+class BroadcastResponse(BaseModel):
+    sent_count: int
+    blocked_count: int
+    rejected_count: int
+    results: List[BroadcastResult]
+
+
+class PermissionCheckRequest(BaseModel):
+    receiver_ids: List[int] = Field(..., max_length=1000)
+
+
+class PermissionCheckResult(BaseModel):
+    receiver_id: int
+    allowed: bool
+    reason: str
+
+
 class MessageLogResponse(BaseModel):
     id: int
     sender_id: int
@@ -118,17 +152,39 @@ class MessageLogResponse(BaseModel):
     timestamp: datetime
     status: str
     reason: Optional[str] = None
+    email_status: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class MessageLogPage(BaseModel):
+    items: List[MessageLogResponse]
+    next_cursor: Optional[str] = None
+    next_since_id: Optional[int] = None
+
+
+class MessageStatsResponse(BaseModel):
+    day: Optional[date] = None
+    sender_dept_id: Optional[int] = None
+    receiver_dept_id: Optional[int] = None
+    user_id: Optional[int] = None
+    sent: int
+    blocked: int
+    total: int
+
+
 # Token Schemas
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int
+
+
 class TokenData(BaseModel):
     email: Optional[str] = None
 
@@ -0,0 +1,30 @@
+"""
+Fast serialization path for large list responses.
+
+List endpoints select only the columns of their response schema, so no ORM
+entities are built, and write the rows with orjson instead of validating
+each one through pydantic and encoding it with the stdlib json module. The
+output matches what response_model produces: the same fields in the same
+order, and datetimes in ISO 8601 with "Z" for UTC as pydantic writes them.
+response_model stays on the routes for the OpenAPI schema.
+
+benchmarks/serialization.py compares this path with the ORM + pydantic one.
+"""
+from typing import Any, Iterable, List, Type
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def response_columns(model, schema: Type[BaseModel]) -> list:
+    """The model's columns for each field of schema, in field order."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+def rows_as_dicts(rows: Iterable[Any]) -> List[dict]:
+    return [row._asdict() for row in rows]
@@ -0,0 +1,50 @@
+"""
+Name/email search for the recipient picker.
+
+Matches are substrings of the name or email, case-insensitive. On PostgreSQL
+the ILIKE filter is served by the pg_trgm GIN indexes on users; on SQLite,
+queries of three characters or more go through the users_fts trigram table
+(shorter ones fall back to a scan). Both are created with the users table,
+see USER_SEARCH_DDL in app.models.
+
+Results are ranked: name prefix, then a word in the name starting with the
+query, then email prefix, then any other match; ties by name and id.
+"""
+from sqlalchemy import ColumnElement, case, func, or_, text
+from app import models
+
+# The trigram tokenizer cannot match anything shorter than a trigram
+FTS_MIN_QUERY_LENGTH = 3
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def search_filter(dialect_name: str, q: str) -> ColumnElement:
+    """Criterion matching users whose name or email contains q."""
+    if dialect_name == "sqlite" and len(q) >= FTS_MIN_QUERY_LENGTH:
+        return text(
+            "users.id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH :user_search)"
+        ).bindparams(user_search=_fts_phrase(q))
+    pattern = f"%{_like_escape(q)}%"
+    return or_(
+        models.User.name.ilike(pattern, escape="\\"),
+        models.User.email.ilike(pattern, escape="\\")
+    )
+
+
+def search_rank(q: str) -> ColumnElement:
+    """Sort key, lower is better."""
+    prefix = f"{_like_escape(q.lower())}%"
+    name = func.lower(models.User.name)
+    return case(
+        (name.like(prefix, escape="\\"), 0),
+        (name.like(f"% {prefix}", escape="\\"), 1),
+        (func.lower(models.User.email).like(prefix, escape="\\"), 2),
+        else_=3
+    )
@@ -0,0 +1,65 @@
+"""
+Script to rebuild the message statistics rollups from existing message logs.
+Run it once after upgrading, or any time the rollups need to be rebuilt.
+
+The rollups are cleared and then refilled from message_logs in id-ordered
+chunks, each aggregated in SQL and committed on its own. Messages logged
+while the backfill runs are counted by the application as usual; run it at
+a quiet time so that none are logged between the reset and the first chunk.
+
+Usage:
+    python backfill_message_stats.py [chunk_size]
+"""
+import asyncio
+import sys
+from collections import Counter
+from datetime import date
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import aliased
+from app.database import engine, Base, AsyncSessionLocal
+from app import models
+from app.message_stats import add_message_counts, utc_day
+
+
+async def backfill_message_stats(chunk_size: int = 50000):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(models.MessageStatsDaily))
+        await db.execute(delete(models.UserMessageStatsDaily))
+        max_id = (await db.execute(select(func.max(models.MessageLog.id)))).scalar() or 0
+        await db.commit()
+        print(f"Cleared rollups, rebuilding from {max_id} message logs")
+
+        sender = aliased(models.User)
+        receiver = aliased(models.User)
+        day = utc_day(models.MessageLog.timestamp, db.get_bind().dialect.name)
+        for start_id in range(0, max_id, chunk_size):
+            end_id = min(start_id + chunk_size, max_id)
+            result = await db.execute(
+                select(day, models.MessageLog.sender_id, sender.dept_id, receiver.dept_id,
+                       models.MessageLog.status, func.count())
+                .join(sender, sender.id == models.MessageLog.sender_id)
+                .join(receiver, receiver.id == models.MessageLog.receiver_id)
+                .filter(models.MessageLog.id > start_id, models.MessageLog.id <= end_id)
+                .group_by(day, models.MessageLog.sender_id, sender.dept_id, receiver.dept_id,
+                          models.MessageLog.status)
+            )
+            dept_counts = Counter()
+            user_counts = Counter()
+            for message_day, sender_id, sender_dept_id, receiver_dept_id, status, count in result.all():
+                # SQLite's date() returns text
+                if isinstance(message_day, str):
+                    message_day = date.fromisoformat(message_day)
+                dept_counts[(message_day, sender_dept_id, receiver_dept_id, status)] += count
+                user_counts[(message_day, sender_id, status)] += count
+            await add_message_counts(db, dept_counts, user_counts)
+            await db.commit()
+            print(f"Processed message logs up to id {end_id}")
+
+    print("Message statistics rebuilt successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_message_stats(int(sys.argv[1]) if len(sys.argv) > 1 else 50000))
@@ -0,0 +1,156 @@
+"""
+Benchmark communication rule lookups between two departments.
+
+Fills a scratch database with a large communication_rules table and times:
+- the legacy OR over (dept_a_id, dept_b_id) / (dept_b_id, dept_a_id)
+- the canonical (low_dept_id, high_dept_id) probe on ix_communication_rules_dept_pair
+- the in-memory permission graph
+
+Usage:
+    python -m benchmarks.rule_pair_lookup --rules 1000000
+    python -m benchmarks.rule_pair_lookup --database-url postgresql+asyncpg://... --rules 1000000
+
+Point --database-url at a scratch database: its tables are dropped and recreated.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.database import Base
+from app import models
+from app.permission_graph import PermissionGraph
+from app.permissions import dept_pair_filter
+
+
+def percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_us": round(statistics.median(samples), 1),
+        "p95_us": round(samples[int(len(samples) * 0.95) - 1], 1),
+        "p99_us": round(samples[int(len(samples) * 0.99) - 1], 1),
+    }
+
+
+async def seed(engine, departments: int, rules: int, batch_size: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(models.Role), [{"id": 1, "name": "admin"}])
+        await conn.execute(insert(models.Department), [{"id": i, "name": f"Dept {i}"} for i in range(1, departments + 1)])
+        await conn.execute(insert(models.User), [{
+            "id": 1, "name": "Bench Admin", "email": "bench@example.com",
+            "password_hash": "x", "dept_id": 1, "role_id": 1,
+        }])
+
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    inserted = 0
+    while inserted < rules:
+        batch = []
+        for _ in range(min(batch_size, rules - inserted)):
+            dept_a_id, dept_b_id = rng.sample(range(1, departments + 1), 2)
+            temporary = rng.random() < 0.7
+            batch.append({
+                "dept_a_id": dept_a_id,
+                "dept_b_id": dept_b_id,
+                "low_dept_id": min(dept_a_id, dept_b_id),
+                "high_dept_id": max(dept_a_id, dept_b_id),
+                "rule_type": "temporary" if temporary else "permanent",
+                "requester_id": 1 if temporary else None,
+                "approved_by_id": 1,
+                "expiry_timestamp": now + timedelta(hours=rng.randint(-48, 48)) if temporary else None,
+                "user_specific": temporary and rng.random() < 0.3,
+                "is_active": rng.random() < 0.8,
+            })
+        async with engine.begin() as conn:
+            await conn.execute(insert(models.CommunicationRule), batch)
+        inserted += len(batch)
+
+
+async def time_queries(session: AsyncSession, pairs, build_query) -> list[float]:
+    samples = []
+    for dept_x_id, dept_y_id in pairs:
+        start = time.perf_counter()
+        result = await session.execute(build_query(dept_x_id, dept_y_id))
+        result.first()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def legacy_query(dept_x_id: int, dept_y_id: int):
+    rule = models.CommunicationRule
+    return select(rule.id).filter(
+        rule.is_active == True,
+        rule.rule_type == "permanent",
+        or_(
+            and_(rule.dept_a_id == dept_x_id, rule.dept_b_id == dept_y_id),
+            and_(rule.dept_a_id == dept_y_id, rule.dept_b_id == dept_x_id)
+        )
+    ).limit(1)
+
+
+def pair_query(dept_x_id: int, dept_y_id: int):
+    rule = models.CommunicationRule
+    return select(rule.id).filter(
+        dept_pair_filter(dept_x_id, dept_y_id),
+        rule.rule_type == "permanent",
+        rule.is_active == True
+    ).limit(1)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./bench_rules.db")
+    parser.add_argument("--rules", type=int, default=1_000_000)
+    parser.add_argument("--departments", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20_000)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the rules already in the database")
+    args = parser.parse_args()
+
+    engine = create_async_engine(args.database_url)
+    if not args.skip_seed:
+        start = time.perf_counter()
+        await seed(engine, args.departments, args.rules, args.batch_size)
+        print(f"Seeded {args.rules} rules in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(7)
+    pairs = [tuple(rng.sample(range(1, args.departments + 1), 2)) for _ in range(args.lookups)]
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as session:
+        # Warm up the connection and statement caches
+        await time_queries(session, pairs[:5], pair_query)
+        legacy = await time_queries(session, pairs, legacy_query)
+        pair = await time_queries(session, pairs, pair_query)
+
+        graph = PermissionGraph()
+        start = time.perf_counter()
+        await graph.rebuild(session)
+        build_seconds = time.perf_counter() - start
+
+    graph_samples = []
+    for dept_x_id, dept_y_id in pairs:
+        start = time.perf_counter()
+        graph.check(1, dept_x_id, dept_y_id)
+        graph_samples.append((time.perf_counter() - start) * 1e6)
+
+    await engine.dispose()
+    print(json.dumps({
+        "rules": args.rules,
+        "departments": args.departments,
+        "lookups": args.lookups,
+        "legacy_or_query": percentiles(legacy),
+        "dept_pair_index_query": percentiles(pair),
+        "permission_graph": percentiles(graph_samples),
+        "permission_graph_build_s": round(build_seconds, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,243 @@
+"""
+Script to fill the database with a large synthetic organisation for load testing.
+Builds on init_db: creates the tables and default roles, then bulk-inserts
+departments, users, communication rules and message logs.
+
+Users share one precomputed password hash, and rows are written in batches
+with executemany (or COPY on PostgreSQL/asyncpg for message logs), so a
+10M-message dataset takes minutes rather than hours. The message statistics
+rollups are rebuilt at the end.
+
+The rule mix covers permanent rules, live temporary rules (department-wide
+and user-specific), expired temporary rules (some already deactivated, some
+still waiting for the expiry scheduler) and pending requests.
+
+Usage:
+    python generate_synthetic_data.py --departments 200 --users 20000 --rules 5000 --messages 10000000
+
+Names and emails are prefixed with --prefix, so run it again with a new
+prefix to add a second organisation to the same database.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, select
+from app.database import engine, Base, AsyncSessionLocal
+from app import models
+from app.auth import get_password_hash
+from app.http_cache import bump
+from backfill_message_stats import backfill_message_stats
+from init_db import create_default_roles
+
+# Fractions of the generated rules
+RULE_MIX = {
+    "permanent": 0.35,
+    "temporary": 0.25,
+    "user_specific": 0.15,
+    "expired": 0.15,
+    "pending": 0.10,
+}
+
+MESSAGE_COLUMNS = ["sender_id", "receiver_id", "subject", "message_content", "timestamp", "status", "reason"]
+BLOCKED_REASON = "No communication rule found between departments"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--departments", type=int, default=100)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--rules", type=int, default=2_000)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=365, help="Spread message timestamps over this many past days")
+    parser.add_argument("--batch-size", type=int, default=20_000, help="Rows per executemany/COPY batch")
+    parser.add_argument("--password", default="Synthetic1!", help="Password shared by every generated user")
+    parser.add_argument("--prefix", default="synthetic", help="Prefix for department names and user emails")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-stats", action="store_true", help="Do not rebuild the message statistics rollups")
+    return parser.parse_args()
+
+
+async def insert_returning_ids(conn, model, rows: list[dict]) -> list[int]:
+    result = await conn.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows)
+    return list(result.scalars().all())
+
+
+async def generate_departments(args) -> list[int]:
+    rows = [{"name": f"{args.prefix} department {n}"} for n in range(1, args.departments + 1)]
+    async with AsyncSessionLocal() as db:
+        await bump(db, "departments")
+        dept_ids = await insert_returning_ids(db, models.Department, rows)
+        await db.commit()
+    return dept_ids
+
+
+async def generate_users(args, rng: random.Random, dept_ids: list[int], role_ids: dict) -> dict:
+    """Spread users over the departments: one manager each, about 1% auditors, the rest users."""
+    password_hash = get_password_hash(args.password)
+    users_by_dept = defaultdict(list)
+    managers = {}
+    for start in range(0, args.users, args.batch_size):
+        rows = []
+        for n in range(start, min(start + args.batch_size, args.users)):
+            dept_id = dept_ids[n % len(dept_ids)]
+            if n < len(dept_ids):
+                role = "manager"
+            elif rng.random() < 0.01:
+                role = "auditor"
+            else:
+                role = "user"
+            rows.append({
+                "name": f"{args.prefix.title()} User {n + 1}",
+                "email": f"{args.prefix}.user{n + 1}@example.com",
+                "password_hash": password_hash,
+                "dept_id": dept_id,
+                "role_id": role_ids[role],
+            })
+        async with engine.begin() as conn:
+            user_ids = await insert_returning_ids(conn, models.User, rows)
+        for user_id, row in zip(user_ids, rows):
+            users_by_dept[row["dept_id"]].append(user_id)
+            if row["role_id"] == role_ids["manager"]:
+                managers[row["dept_id"]] = user_id
+        print(f"Inserted {start + len(rows)} users")
+    return {"by_dept": users_by_dept, "managers": managers}
+
+
+async def generate_rules(args, rng: random.Random, dept_ids: list[int], users: dict) -> dict:
+    """Insert the rules and return the departments each department may message."""
+    now = datetime.now(timezone.utc)
+    kinds = list(RULE_MIX)
+    weights = list(RULE_MIX.values())
+    reachable = defaultdict(set)
+    rows = []
+    for _ in range(args.rules):
+        dept_a_id, dept_b_id = rng.sample(dept_ids, 2)
+        kind = rng.choices(kinds, weights)[0]
+        requester_id = rng.choice(users["by_dept"][dept_a_id]) if users["by_dept"][dept_a_id] else None
+        approver_id = users["managers"].get(dept_b_id) or requester_id
+        if approver_id is None:
+            continue
+        row = {
+            "dept_a_id": dept_a_id,
+            "dept_b_id": dept_b_id,
+            "low_dept_id": min(dept_a_id, dept_b_id),
+            "high_dept_id": max(dept_a_id, dept_b_id),
+            "rule_type": "temporary",
+            "requester_id": requester_id,
+            "approved_by_id": approver_id,
+            "expiry_timestamp": now + timedelta(hours=rng.randint(1, 24 * 30)),
+            "user_specific": False,
+            "reason": f"Synthetic {kind} rule",
+            "is_active": True,
+        }
+        if kind == "permanent":
+            row.update(rule_type="permanent", requester_id=None, expiry_timestamp=None)
+        elif kind == "user_specific":
+            row.update(user_specific=True)
+        elif kind == "expired":
+            row.update(expiry_timestamp=now - timedelta(hours=rng.randint(1, 24 * 90)), is_active=rng.random() < 0.5)
+        elif kind == "pending":
+            # Pending requests carry the requester as approver, as request_temporary_access does
+            row.update(approved_by_id=requester_id or approver_id, is_active=False)
+        rows.append(row)
+        if kind in ("permanent", "temporary"):
+            reachable[dept_a_id].add(dept_b_id)
+            reachable[dept_b_id].add(dept_a_id)
+
+    for start in range(0, len(rows), args.batch_size):
+        async with engine.begin() as conn:
+            await conn.execute(insert(models.CommunicationRule), rows[start:start + args.batch_size])
+    print(f"Inserted {len(rows)} communication rules")
+    return reachable
+
+
+def message_batch(rng: random.Random, size: int, dept_ids: list[int], users: dict, reachable: dict, now: datetime, days: int) -> list[tuple]:
+    """
+    Messages go mostly to the sender's own or a reachable department, so about
+    85% are sent; the rest go anywhere and are blocked unless allowed.
+    """
+    by_dept = users["by_dept"]
+    reachable_lists = {dept_id: list(depts) for dept_id, depts in reachable.items()}
+    span = days * 86400
+    rows = []
+    for _ in range(size):
+        sender_dept_id = rng.choice(dept_ids)
+        sender_id = rng.choice(by_dept[sender_dept_id])
+        roll = rng.random()
+        if roll < 0.5 or not reachable_lists.get(sender_dept_id):
+            receiver_dept_id = sender_dept_id if roll < 0.85 else rng.choice(dept_ids)
+        elif roll < 0.85:
+            receiver_dept_id = rng.choice(reachable_lists[sender_dept_id])
+        else:
+            receiver_dept_id = rng.choice(dept_ids)
+        receiver_id = rng.choice(by_dept[receiver_dept_id])
+        if receiver_id == sender_id:
+            receiver_id = rng.choice(by_dept[receiver_dept_id])
+        allowed = receiver_dept_id == sender_dept_id or receiver_dept_id in reachable[sender_dept_id]
+        timestamp = (now - timedelta(seconds=rng.randrange(span))).replace(microsecond=0)
+        rows.append((
+            sender_id,
+            receiver_id,
+            "Synthetic message",
+            "Synthetic message body",
+            timestamp,
+            "sent" if allowed else "blocked",
+            None if allowed else BLOCKED_REASON,
+        ))
+    return rows
+
+
+async def generate_messages(args, rng: random.Random, dept_ids: list[int], users: dict, reachable: dict):
+    now = datetime.now(timezone.utc)
+    use_copy = engine.dialect.driver == "asyncpg"
+    inserted = 0
+    started = time.perf_counter()
+    while inserted < args.messages:
+        size = min(args.batch_size, args.messages - inserted)
+        rows = message_batch(rng, size, dept_ids, users, reachable, now, args.days)
+        async with engine.begin() as conn:
+            if use_copy:
+                raw_connection = await conn.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(
+                    models.MessageLog.__tablename__, records=rows, columns=MESSAGE_COLUMNS
+                )
+            else:
+                await conn.execute(insert(models.MessageLog), [dict(zip(MESSAGE_COLUMNS, row)) for row in rows])
+        inserted += size
+        rate = inserted / (time.perf_counter() - started)
+        print(f"Inserted {inserted} message logs ({rate:,.0f} rows/s)")
+
+
+async def generate(args):
+    rng = random.Random(args.seed)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        role_ids = await create_default_roles(db)
+        await db.commit()
+        existing = await db.execute(
+            select(models.Department.id).filter(models.Department.name.like(f"{args.prefix} department %")).limit(1)
+        )
+        if existing.first():
+            raise SystemExit(f"Departments with prefix '{args.prefix}' already exist; pass a different --prefix")
+
+    started = time.perf_counter()
+    dept_ids = await generate_departments(args)
+    print(f"Inserted {len(dept_ids)} departments")
+    users = await generate_users(args, rng, dept_ids, role_ids)
+    reachable = await generate_rules(args, rng, dept_ids, users)
+    await generate_messages(args, rng, dept_ids, users, reachable)
+    if not args.skip_stats:
+        await backfill_message_stats()
+    print(f"Synthetic data generated in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.departments < 2 or arguments.users < arguments.departments:
+        raise SystemExit("Need at least 2 departments and one user per department")
+    asyncio.run(generate(arguments))
@@ -5,8 +5,28 @@ Run this once after setting up the database.
 import asyncio
 from app.database import engine, Base, AsyncSessionLocal
 from app import models
+from app.http_cache import bump
 from sqlalchemy import select
 
+DEFAULT_ROLES = ["admin", "manager", "user", "auditor"]
+
+
+async def create_default_roles(db) -> dict:
+    """Add any missing default roles and return all role ids by name. Does not commit."""
+    result = await db.execute(select(models.Role.name, models.Role.id))
+    role_ids = dict(result.all())
+    missing = [role_name for role_name in DEFAULT_ROLES if role_name not in role_ids]
+    if missing:
+        await bump(db, "roles")
+    for role_name in missing:
+        new_role = models.Role(name=role_name)
+        db.add(new_role)
+        await db.flush()
+        role_ids[role_name] = new_role.id
+        print(f"Created role: {role_name}")
+    return role_ids
+
+
 async def init_db():
     # Create all tables
     async with engine.begin() as conn:
@@ -15,14 +35,7 @@ async def init_db():
     async with AsyncSessionLocal() as db:
         try:
             # Create default roles if they don't exist
-            roles = ["admin", "manager", "user", "auditor"]
-            for role_name in roles:
-                result = await db.execute(select(models.Role).filter(models.Role.name == role_name))
-                existing_role = result.scalar_one_or_none()
-                if not existing_role:
-                    new_role = models.Role(name=role_name)
-                    db.add(new_role)
-                    print(f"Created role: {role_name}")
+            await create_default_roles(db)
             
             await db.commit()
             print("Database initialized successfully!")
@@ -0,0 +1,72 @@
+"""
+Shared test setup.
+
+Tests run against a throwaway SQLite database. DATABASE_URL has to be set
+before app.database is imported, as the engine is built at import time.
+
+Usage (from the repository root):
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import asyncio
+import os
+import tempfile
+
+_database_dir = tempfile.mkdtemp(prefix="privateroute-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_database_dir}/test.db"
+
+import pytest
+from app.database import engine, Base, AsyncSessionLocal
+from app import models
+from app.auth import get_password_hash
+from app.permission_graph import permission_graph
+from app.principal_cache import principal_cache
+
+PASSWORD = "Passw0rd!"
+ROLES = ["admin", "manager", "user", "auditor"]
+
+
+async def _reset_database():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+@pytest.fixture
+def database():
+    """An empty schema, with the in-process caches that mirror it cleared."""
+    asyncio.run(_reset_database())
+    permission_graph.invalidate()
+    principal_cache.clear()
+    yield AsyncSessionLocal
+
+
+@pytest.fixture
+def organisation(database):
+    """
+    Roles, departments 1-6 and two users per department, all with PASSWORD.
+    Returns {user name: (user id, department id)}; users are named
+    "user<dept>a" and "user<dept>b", and "admin" (department 1) is an admin.
+    """
+    async def seed():
+        password_hash = get_password_hash(PASSWORD)
+        users = {}
+        async with AsyncSessionLocal() as db:
+            db.add_all([models.Role(id=i, name=name) for i, name in enumerate(ROLES, start=1)])
+            db.add_all([models.Department(id=i, name=f"Department {i}") for i in range(1, 7)])
+            await db.flush()
+            accounts = [("admin", 1, 1)] + [
+                (f"user{dept_id}{suffix}", dept_id, 3) for dept_id in range(1, 7) for suffix in "ab"
+            ]
+            for name, dept_id, role_id in accounts:
+                user = models.User(
+                    name=name, email=f"{name}@example.com", password_hash=password_hash,
+                    dept_id=dept_id, role_id=role_id
+                )
+                db.add(user)
+                await db.flush()
+                users[name] = (user.id, dept_id)
+            await db.commit()
+        return users
+
+    return asyncio.run(seed())
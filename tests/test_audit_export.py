@@ -0,0 +1,87 @@
+"""
+A message log export holds one pooled connection, the one it streams from,
+however long it runs.
+"""
+import asyncio
+import json
+import httpx
+from app import models
+from app.database import AsyncSessionLocal, pool_stats
+from app.main import app
+from app.principal_cache import principal_cache
+from conftest import PASSWORD
+
+MESSAGE_COUNT = 50
+
+
+async def stream(path: str, query_string: str, token: str):
+    """
+    Run a GET through the ASGI app directly, noting how many pooled
+    connections are checked out as each body chunk is sent.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query_string.encode(), "client": ("127.0.0.1", 50000), "server": ("test", 80),
+        "headers": [(b"host", b"test"), (b"authorization", f"Bearer {token}".encode())],
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    response = {"status": None, "body": b"", "connections_held": []}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            response["connections_held"].append(pool_stats.checkouts - pool_stats.checkins)
+            response["body"] += message["body"]
+
+    await app(scope, receive, send)
+    return response
+
+
+def test_export_holds_only_its_streaming_connection(organisation):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            db.add_all([
+                models.MessageLog(sender_id=organisation["user1a"][0], receiver_id=organisation["user1b"][0],
+                                  subject=f"Message {n}", message_content="Hi", status="sent")
+                for n in range(MESSAGE_COUNT)
+            ])
+            await db.commit()
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post("/api/auth/login", data={"username": "admin@example.com", "password": PASSWORD})
+        # Authenticating has to go to the database
+        principal_cache.clear()
+        return await stream("/api/audit/message-logs/export", "format=ndjson&chunk_size=10", login.json()["access_token"])
+
+    response = asyncio.run(scenario())
+    assert response["status"] == 200
+    assert len(response["body"].decode().splitlines()) == MESSAGE_COUNT
+    assert json.loads(response["body"].decode().splitlines()[0])["subject"] == "Message 0"
+    assert len(response["connections_held"]) > 1
+    assert max(response["connections_held"]) == 1
+
+
+def test_export_requires_admin_or_auditor(organisation):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post("/api/auth/login", data={"username": "user1a@example.com", "password": PASSWORD})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            forbidden = await client.get("/api/audit/message-logs/export", headers=headers)
+            anonymous = await client.get("/api/audit/message-logs/export")
+        return forbidden.status_code, anonymous.status_code
+
+    assert asyncio.run(scenario()) == (403, 401)
@@ -0,0 +1,188 @@
+"""
+EmailSink against a local aiosmtpd server: a batch goes out over one SMTP
+session, failures are retried with backoff, and each message's email_status
+ends up 'sent' or 'failed'.
+"""
+import asyncio
+import socket
+from datetime import datetime, timezone
+import httpx
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import select
+from app import models
+from app.database import AsyncSessionLocal, settings
+from app.main import app
+from app.outbox import MESSAGE_SENT, OutboxDispatcher
+from app.outbox_sinks import EmailSink
+from conftest import PASSWORD
+
+
+class RecordingHandler:
+    """Counts SMTP sessions and refuses the addresses in refused."""
+
+    def __init__(self, refused=()):
+        self.refused = set(refused)
+        self.sessions = 0
+        self.recipients = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.recipients.extend(envelope.rcpt_tos)
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp_port(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    monkeypatch.setattr(settings, "mail_server", "127.0.0.1")
+    monkeypatch.setattr(settings, "mail_port", port)
+    monkeypatch.setattr(settings, "mail_starttls", False)
+    monkeypatch.setattr(settings, "mail_ssl_tls", False)
+    monkeypatch.setattr(settings, "mail_username", "")
+    monkeypatch.setattr(settings, "mail_timeout_seconds", 5.0)
+    return port
+
+
+def make_dispatcher(max_attempts: int) -> OutboxDispatcher:
+    dispatcher = OutboxDispatcher(
+        batch_size=10, poll_interval_seconds=60, max_attempts=max_attempts,
+        retry_base_seconds=30, retry_max_seconds=300, lease_seconds=60
+    )
+    dispatcher.register(EmailSink())
+    return dispatcher
+
+
+async def send_messages(dispatcher: OutboxDispatcher, sender_id: int, receiver_ids: list, subjects=None) -> list:
+    """Log sent messages and enqueue their notifications, as send_message does."""
+    subjects = subjects or ["Hello"] * len(receiver_ids)
+    async with AsyncSessionLocal() as db:
+        messages = [
+            models.MessageLog(sender_id=sender_id, receiver_id=receiver_id, subject=subject,
+                              message_content="Hi there", status="sent", email_status="pending")
+            for receiver_id, subject in zip(receiver_ids, subjects)
+        ]
+        db.add_all(messages)
+        await db.flush()
+        await dispatcher.enqueue(db, MESSAGE_SENT, [
+            {"message_id": message.id, "sender_id": sender_id, "receiver_id": message.receiver_id,
+             "subject": message.subject, "message_content": message.message_content}
+            for message in messages
+        ])
+        await db.commit()
+        return [message.id for message in messages]
+
+
+async def email_states(message_ids: list) -> list:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.MessageLog.email_status, models.MessageLog.email_attempts)
+            .filter(models.MessageLog.id.in_(message_ids))
+            .order_by(models.MessageLog.id)
+        )
+        return [tuple(row) for row in result.all()]
+
+
+def test_batch_is_retried_then_sent_over_one_connection(organisation, smtp_port):
+    sender_id = organisation["user1a"][0]
+    receivers = ["user2a", "user2b", "user3a", "user3b"]
+    handler = RecordingHandler(refused={"user3b@example.com"})
+
+    async def scenario():
+        dispatcher = make_dispatcher(max_attempts=5)
+        message_ids = await send_messages(dispatcher, sender_id, [organisation[name][0] for name in receivers])
+        now = datetime.now(timezone.utc)
+
+        # Nothing listens on the port yet: the whole batch is retried later
+        assert await dispatcher.dispatch_due(now) == 4
+        assert await email_states(message_ids) == [("pending", 1)] * 4
+        # Backing off: not due again before the first retry interval
+        assert await dispatcher.dispatch_due(now) == 0
+
+        controller = Controller(handler, hostname="127.0.0.1", port=smtp_port)
+        controller.start()
+        try:
+            assert await dispatcher.dispatch_due(now + dispatcher.backoff(1)) == 4
+        finally:
+            controller.stop()
+
+        assert handler.sessions == 1
+        assert sorted(handler.recipients) == ["user2a@example.com", "user2b@example.com", "user3a@example.com"]
+        # A refused recipient is a permanent failure, not retried
+        assert await email_states(message_ids) == [("sent", 2), ("sent", 2), ("sent", 2), ("failed", 2)]
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_after_max_attempts(organisation, smtp_port):
+    async def scenario():
+        dispatcher = make_dispatcher(max_attempts=3)
+        message_ids = await send_messages(dispatcher, organisation["user1a"][0], [organisation["user2a"][0]])
+        now = datetime.now(timezone.utc)
+
+        for attempts in (1, 2):
+            assert await dispatcher.dispatch_due(now) == 1
+            assert await email_states(message_ids) == [("pending", attempts)]
+            now += dispatcher.backoff(attempts)
+        assert await dispatcher.dispatch_due(now) == 1
+        assert await email_states(message_ids) == [("failed", 3)]
+        assert await dispatcher.dispatch_due(now + dispatcher.backoff(3)) == 0
+
+    asyncio.run(scenario())
+
+
+def test_unbuildable_email_fails_alone(organisation, smtp_port):
+    receivers = ["user2a", "user2b", "user3a", "user3b"]
+    handler = RecordingHandler()
+
+    async def scenario():
+        dispatcher = make_dispatcher(max_attempts=3)
+        # Logged before subjects were validated at the API
+        message_ids = await send_messages(
+            dispatcher, organisation["user1a"][0], [organisation[name][0] for name in receivers],
+            subjects=["Hello", "Hello\r\nBcc: everyone@example.com", "Hello", "Hello"]
+        )
+        controller = Controller(handler, hostname="127.0.0.1", port=smtp_port)
+        controller.start()
+        try:
+            assert await dispatcher.dispatch_due() == 4
+        finally:
+            controller.stop()
+
+        assert handler.sessions == 1
+        assert sorted(handler.recipients) == ["user2a@example.com", "user3a@example.com", "user3b@example.com"]
+        assert await email_states(message_ids) == [("sent", 1), ("failed", 1), ("sent", 1), ("sent", 1)]
+
+    asyncio.run(scenario())
+
+
+def test_subject_line_breaks_are_rejected(organisation):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post(
+                "/api/auth/login", data={"username": "user1a@example.com", "password": PASSWORD}
+            )
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            subject = "Hello\nBcc: everyone@example.com"
+            single = await client.post("/api/messages/send", headers=headers, json={
+                "receiver_id": organisation["user1b"][0], "subject": subject, "message_content": "Hi"
+            })
+            bulk = await client.post("/api/messages/send-bulk", headers=headers, json={
+                "receiver_ids": [organisation["user1b"][0]], "subject": subject, "message_content": "Hi"
+            })
+        return single.status_code, bulk.status_code
+
+    assert asyncio.run(scenario()) == (422, 422)
@@ -0,0 +1,55 @@
+"""
+Log listings page newest first by (timestamp, id): messages logged in the
+same second are neither repeated nor skipped across a page boundary.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+import httpx
+import pytest
+from app import models
+from app.database import AsyncSessionLocal
+from app.main import app
+from conftest import PASSWORD
+
+
+async def log_messages(organisation: dict) -> list:
+    """Seven messages, five of them logged in the same second; ids newest first by (timestamp, id)."""
+    tied = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    timestamps = [tied - timedelta(seconds=1)] + [tied] * 5 + [tied + timedelta(seconds=1)]
+    async with AsyncSessionLocal() as db:
+        logs = [
+            models.MessageLog(sender_id=organisation["user1a"][0], receiver_id=organisation["user1b"][0],
+                              subject=f"Message {n}", message_content="Hi", status="sent", timestamp=timestamp)
+            for n, timestamp in enumerate(timestamps)
+        ]
+        db.add_all(logs)
+        await db.commit()
+        return [log.id for log in sorted(logs, key=lambda log: (log.timestamp, log.id), reverse=True)]
+
+
+@pytest.mark.parametrize("path", ["/api/messages/logs", "/api/audit/message-logs"])
+def test_tied_timestamps_page_without_gaps_or_repeats(organisation, path):
+    async def scenario():
+        expected = await log_messages(organisation)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post("/api/auth/login", data={"username": "admin@example.com", "password": PASSWORD})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+            pages = []
+            params = {"limit": 2}
+            while True:
+                response = await client.get(path, headers=headers, params=params)
+                assert response.status_code == 200
+                pages.append([item["id"] for item in response.json()["items"]])
+                if not response.json()["next_cursor"]:
+                    break
+                params = {"limit": 2, "cursor": response.json()["next_cursor"]}
+
+            invalid = await client.get(path, headers=headers, params={"cursor": "not a cursor"})
+        return expected, pages, invalid.status_code
+
+    expected, pages, invalid_status = asyncio.run(scenario())
+    # Every boundary but the last falls inside the tied second
+    assert pages == [expected[0:2], expected[2:4], expected[4:6], expected[6:7]]
+    assert invalid_status == 400
@@ -0,0 +1,118 @@
+"""
+Mailbox listings: cursors walk every message once, since_id returns only
+newer messages, and an unchanged mailbox answers If-None-Match with 304.
+"""
+import asyncio
+import httpx
+from app.main import app
+from conftest import PASSWORD
+
+
+async def login(client: httpx.AsyncClient, username: str) -> dict:
+    response = await client.post("/api/auth/login", data={"username": username, "password": PASSWORD})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def send(client: httpx.AsyncClient, headers: dict, receiver_id: int, count: int):
+    for n in range(count):
+        response = await client.post("/api/messages/send", headers=headers, json={
+            "receiver_id": receiver_id, "subject": f"Message {n}", "message_content": "Hi"
+        })
+        assert response.status_code == 201
+
+
+def test_cursor_pages_cover_the_mailbox_once(organisation):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            sender = await login(client, "user1a@example.com")
+            receiver = await login(client, "user1b@example.com")
+            await send(client, sender, organisation["user1b"][0], 5)
+
+            pages = []
+            params = {"limit": 2}
+            while True:
+                response = await client.get("/api/messages/received", headers=receiver, params=params)
+                assert response.status_code == 200
+                pages.append(response.json())
+                if not pages[-1]["next_cursor"]:
+                    break
+                params = {"limit": 2, "cursor": pages[-1]["next_cursor"]}
+        return pages
+
+    pages = asyncio.run(scenario())
+    ids = [item["id"] for page in pages for item in page["items"]]
+    assert [len(page["items"]) for page in pages] == [2, 2, 1]
+    assert ids == sorted(ids, reverse=True) and len(set(ids)) == 5
+    # Only the first page says where delta syncing starts
+    assert pages[0]["next_since_id"] == ids[0]
+    assert [page["next_since_id"] for page in pages[1:]] == [None, None]
+
+
+def test_since_id_returns_only_newer_messages(organisation):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            sender = await login(client, "user1a@example.com")
+            receiver = await login(client, "user1b@example.com")
+            await send(client, sender, organisation["user1b"][0], 2)
+            first = (await client.get("/api/messages/received", headers=receiver)).json()
+            since_id = first["next_since_id"]
+
+            await send(client, sender, organisation["user1b"][0], 3)
+            deltas = []
+            while True:
+                response = await client.get(
+                    "/api/messages/received", headers=receiver, params={"since_id": since_id, "limit": 2}
+                )
+                deltas.append(response.json())
+                since_id = deltas[-1]["next_since_id"]
+                if len(deltas[-1]["items"]) < 2:
+                    break
+        return first, deltas
+
+    first, deltas = asyncio.run(scenario())
+    old_ids = {item["id"] for item in first["items"]}
+    new_ids = [item["id"] for page in deltas for item in page["items"]]
+    assert [len(page["items"]) for page in deltas] == [2, 1]
+    # Oldest first, nothing already synced
+    assert new_ids == sorted(new_ids) and len(new_ids) == 3
+    assert min(new_ids) > max(old_ids)
+    assert [item["subject"] for page in deltas for item in page["items"]] == ["Message 0", "Message 1", "Message 2"]
+    assert deltas[-1]["next_since_id"] == new_ids[-1]
+
+
+def test_unchanged_mailbox_is_not_modified(organisation):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            sender = await login(client, "user1a@example.com")
+            receiver = await login(client, "user1b@example.com")
+            await send(client, sender, organisation["user1b"][0], 1)
+
+            listed = await client.get("/api/messages/received", headers=receiver)
+            etag = listed.headers["ETag"]
+            unchanged = await client.get(
+                "/api/messages/received", headers={**receiver, "If-None-Match": etag}
+            )
+            sent = await client.get("/api/messages/sent", headers=sender)
+
+            await send(client, sender, organisation["user1b"][0], 1)
+            changed = await client.get(
+                "/api/messages/received", headers={**receiver, "If-None-Match": etag}
+            )
+            resent = await client.get(
+                "/api/messages/sent", headers={**sender, "If-None-Match": sent.headers["ETag"]}
+            )
+        return listed, unchanged, changed, resent
+
+    listed, unchanged, changed, resent = asyncio.run(scenario())
+    assert len(listed.json()["items"]) == 1
+    assert unchanged.status_code == 304
+    assert unchanged.headers["ETag"] == listed.headers["ETag"]
+    assert unchanged.content == b""
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != listed.headers["ETag"]
+    assert len(changed.json()["items"]) == 2
+    assert resent.status_code == 200
+    assert len(resent.json()["items"]) == 2
@@ -0,0 +1,140 @@
+"""
+The outbox dispatcher claims a batch, delivers it outside any transaction
+and records the outcomes under the claim's lease.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from app import models
+from app.database import AsyncSessionLocal, pool_stats
+from app.outbox import DELIVERED, MESSAGE_SENT, OutboxDispatcher, OutboxSink
+from app.outbox_sinks import EmailSink
+
+
+class RecordingSink(OutboxSink):
+    name = "recording"
+    event_types = frozenset({"test.event"})
+
+    def __init__(self):
+        self.batches = []
+        self.connections_held = []
+
+    async def deliver(self, events):
+        self.connections_held.append(pool_stats.checkouts - pool_stats.checkins)
+        self.batches.append([event.payload["n"] for event in events])
+        return {event.id: DELIVERED for event in events}
+
+
+class AcceptingEmailSink(EmailSink):
+    """EmailSink whose mail server accepts everything; outcomes are mirrored as usual."""
+
+    async def deliver(self, events):
+        return {event.id: DELIVERED for event in events}
+
+
+def make_dispatcher(sink: OutboxSink) -> OutboxDispatcher:
+    dispatcher = OutboxDispatcher(
+        batch_size=10, poll_interval_seconds=60, max_attempts=3,
+        retry_base_seconds=1, retry_max_seconds=60, lease_seconds=30
+    )
+    dispatcher.register(sink)
+    return dispatcher
+
+
+async def enqueue(dispatcher: OutboxDispatcher, count: int):
+    async with AsyncSessionLocal() as db:
+        await dispatcher.enqueue(db, "test.event", [{"n": n} for n in range(count)])
+        await db.commit()
+
+
+async def statuses() -> list:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(models.OutboxEvent.status).order_by(models.OutboxEvent.id))
+        return list(result.scalars().all())
+
+
+def test_delivers_outside_any_transaction(database):
+    async def scenario():
+        sink = RecordingSink()
+        dispatcher = make_dispatcher(sink)
+        await enqueue(dispatcher, 3)
+        assert await dispatcher.dispatch_due() == 3
+        assert sink.batches == [[0, 1, 2]]
+        assert sink.connections_held == [0]
+        assert await statuses() == ["delivered"] * 3
+
+    asyncio.run(scenario())
+
+
+async def send_messages(dispatcher: OutboxDispatcher, sender_id: int, receiver_ids: list) -> list:
+    async with AsyncSessionLocal() as db:
+        messages = [
+            models.MessageLog(sender_id=sender_id, receiver_id=receiver_id, subject="Hello",
+                              message_content="Hi there", status="sent", email_status="pending")
+            for receiver_id in receiver_ids
+        ]
+        db.add_all(messages)
+        await db.flush()
+        await dispatcher.enqueue(db, MESSAGE_SENT, [
+            {"message_id": message.id, "sender_id": sender_id, "receiver_id": message.receiver_id,
+             "subject": message.subject, "message_content": message.message_content}
+            for message in messages
+        ])
+        await db.commit()
+        return [message.id for message in messages]
+
+
+async def email_states(message_ids: list) -> list:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.MessageLog.email_status, models.MessageLog.email_attempts, models.MessageLog.email_error)
+            .filter(models.MessageLog.id.in_(message_ids))
+            .order_by(models.MessageLog.id)
+        )
+        return [tuple(row) for row in result.all()]
+
+
+async def sent_version(user_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.UserMailbox.sent_version).filter(models.UserMailbox.user_id == user_id)
+        )
+        return result.scalar_one_or_none() or 0
+
+
+def test_expired_lease_is_claimed_again_and_stale_outcomes_are_dropped(organisation):
+    sender_id = organisation["user1a"][0]
+
+    async def scenario():
+        sink = AcceptingEmailSink()
+        dispatcher = make_dispatcher(sink)
+        message_ids = await send_messages(
+            dispatcher, sender_id, [organisation["user2a"][0], organisation["user2b"][0]]
+        )
+        now = datetime.now(timezone.utc)
+
+        # A dispatcher claims the batch, then stalls past its lease
+        events, stale_lease = await dispatcher._claim(now)
+        assert len(events) == 2
+        assert await statuses() == ["in_flight"] * 2
+        assert await dispatcher.dispatch_due(now) == 0
+
+        later = now + timedelta(seconds=dispatcher.lease_seconds + 1)
+        assert await dispatcher.dispatch_due(later) == 2
+        assert await statuses() == ["delivered"] * 2
+        assert await email_states(message_ids) == [("sent", 1, None)] * 2
+        version = await sent_version(sender_id)
+
+        # The stalled dispatcher's outcome no longer matches a held lease:
+        # neither the events nor their MessageLog mirror take it
+        failure = [
+            {"id": event.id, "status": "failed", "attempts": 1, "next_attempt_at": None,
+             "last_error": "late", "delivered_at": None}
+            for event in events
+        ]
+        await dispatcher._record([(sink, events, failure)], stale_lease)
+        assert await statuses() == ["delivered"] * 2
+        assert await email_states(message_ids) == [("sent", 1, None)] * 2
+        assert await sent_version(sender_id) == version
+
+    asyncio.run(scenario())
@@ -0,0 +1,263 @@
+"""
+The in-memory permission graph must answer exactly as the per-call queries
+it replaced. reference_check below is check_communication_permission as it
+was before the graph, and every ordered pair of users is compared with it.
+The SQL criterion behind the user search must agree with the graph too.
+"""
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+import httpx
+from sqlalchemy import and_, or_, select, update
+from app import models
+from app.database import AsyncSessionLocal
+from app.main import app
+from app.permission_graph import PermissionGraph, permission_graph
+from app.permissions import check_communication_permissions, communicable_users_filter
+from conftest import PASSWORD
+
+
+async def reference_check(db, sender_id: int, receiver_id: int) -> tuple[bool, str]:
+    sender = (await db.execute(select(models.User).filter(models.User.id == sender_id))).scalar_one_or_none()
+    receiver = (await db.execute(select(models.User).filter(models.User.id == receiver_id))).scalar_one_or_none()
+    if not sender or not receiver:
+        return False, "Sender or receiver not found"
+    if sender.dept_id == receiver.dept_id:
+        return True, "Same department"
+
+    rule = models.CommunicationRule
+    either_direction = or_(
+        and_(rule.dept_a_id == sender.dept_id, rule.dept_b_id == receiver.dept_id),
+        and_(rule.dept_a_id == receiver.dept_id, rule.dept_b_id == sender.dept_id)
+    )
+    permanent = (await db.execute(select(rule).filter(
+        rule.is_active == True, rule.rule_type == "permanent", either_direction
+    ))).scalar_one_or_none()
+    if permanent:
+        return True, "Permanent rule exists"
+
+    now = datetime.now(timezone.utc)
+    temporary = (await db.execute(select(rule).filter(
+        rule.is_active == True, rule.rule_type == "temporary",
+        or_(rule.expiry_timestamp == None, rule.expiry_timestamp > now),
+        either_direction
+    ))).scalar_one_or_none()
+    if temporary:
+        if temporary.user_specific:
+            if temporary.requester_id == sender_id:
+                return True, "Temporary user-specific rule"
+            return False, "Temporary rule is user-specific and doesn't match sender"
+        return True, "Temporary department-wide rule"
+
+    return False, "No communication rule found between departments"
+
+
+def make_rules(users: dict) -> list[models.CommunicationRule]:
+    """At most one rule of each type per pair, so the reference queries stay well defined."""
+    now = datetime.now(timezone.utc)
+    admin_id = users["admin"][0]
+    requester_id = users["user2a"][0]
+
+    def rule(dept_a_id, dept_b_id, rule_type, **fields):
+        return models.CommunicationRule(
+            dept_a_id=dept_a_id, dept_b_id=dept_b_id, rule_type=rule_type, approved_by_id=admin_id, **fields
+        )
+
+    return [
+        rule(1, 2, "permanent"),
+        rule(5, 4, "permanent"),
+        rule(5, 6, "permanent", is_active=False),
+        rule(1, 3, "temporary", expiry_timestamp=now + timedelta(days=1)),
+        rule(4, 1, "temporary", expiry_timestamp=now - timedelta(minutes=1)),
+        rule(3, 5, "temporary", expiry_timestamp=None),
+        rule(2, 3, "temporary", user_specific=True, requester_id=requester_id,
+             expiry_timestamp=now + timedelta(hours=1)),
+        rule(2, 4, "temporary", user_specific=True, requester_id=requester_id,
+             expiry_timestamp=now - timedelta(hours=1)),
+        rule(6, 2, "temporary", user_specific=True, requester_id=requester_id, expiry_timestamp=None),
+    ]
+
+
+async def assert_matches_reference(users: dict):
+    user_ids = [user_id for user_id, _ in users.values()] + [999]
+    async with AsyncSessionLocal() as db:
+        for sender_id in user_ids:
+            results = await check_communication_permissions(db, sender_id, user_ids)
+            for receiver_id in user_ids:
+                expected = await reference_check(db, sender_id, receiver_id)
+                assert results[receiver_id] == expected, (sender_id, receiver_id)
+
+
+def test_graph_matches_reference_queries(organisation):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            db.add_all(make_rules(organisation))
+            await db.commit()
+        await assert_matches_reference(organisation)
+
+    asyncio.run(scenario())
+
+
+def test_incremental_patches_match_reference_queries(organisation):
+    async def scenario():
+        rules = make_rules(organisation)
+        async with AsyncSessionLocal() as db:
+            db.add_all(rules[:3])
+            await db.commit()
+        # Load the graph, then patch it the way the routers do after committing
+        await assert_matches_reference(organisation)
+
+        async with AsyncSessionLocal() as db:
+            db.add_all(rules[3:])
+            await db.commit()
+            for rule in rules[3:]:
+                permission_graph.apply_rule(rule)
+        await assert_matches_reference(organisation)
+
+        async with AsyncSessionLocal() as db:
+            permanent = rules[0]
+            await db.execute(update(models.CommunicationRule).where(models.CommunicationRule.id == permanent.id).values(is_active=False))
+            await db.commit()
+            permission_graph.remove_rule(permanent.id)
+        await assert_matches_reference(organisation)
+
+    asyncio.run(scenario())
+
+
+def test_communicable_users_filter_matches_graph(organisation):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            db.add_all(make_rules(organisation))
+            await db.commit()
+
+        now = datetime.now(timezone.utc)
+        graph = PermissionGraph()
+        async with AsyncSessionLocal() as db:
+            await graph.rebuild(db)
+            for sender_id, sender_dept_id in organisation.values():
+                result = await db.execute(
+                    select(models.User.id).filter(communicable_users_filter(sender_id, now))
+                )
+                expected = {
+                    receiver_id for receiver_id, receiver_dept_id in organisation.values()
+                    if receiver_id != sender_id and graph.check(sender_id, sender_dept_id, receiver_dept_id, now)[0]
+                }
+                assert set(result.scalars().all()) == expected, sender_id
+
+    asyncio.run(scenario())
+
+
+class PausingSession:
+    """Session proxy that stops once the rules are read, before the users query, until resumed."""
+
+    def __init__(self, db):
+        self.db = db
+        self.streams = 0
+        self.paused = asyncio.Event()
+        self.resume = asyncio.Event()
+
+    async def execute(self, *args, **kwargs):
+        return await self.db.execute(*args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        self.streams += 1
+        if self.streams == 2:
+            self.paused.set()
+            await self.resume.wait()
+        return await self.db.stream(*args, **kwargs)
+
+
+def test_patches_during_rebuild_are_not_lost(organisation):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            revoked = models.CommunicationRule(dept_a_id=1, dept_b_id=2, rule_type="permanent", approved_by_id=1)
+            db.add(revoked)
+            await db.commit()
+
+        graph = PermissionGraph()
+        async with AsyncSessionLocal() as db:
+            session = PausingSession(db)
+            rebuild = asyncio.create_task(graph.rebuild(session))
+            await session.paused.wait()
+
+            # The rebuild has read the rules; grant and revoke behind its back
+            async with AsyncSessionLocal() as writer:
+                granted = models.CommunicationRule(dept_a_id=3, dept_b_id=4, rule_type="permanent", approved_by_id=1)
+                writer.add(granted)
+                await writer.execute(update(models.CommunicationRule).where(models.CommunicationRule.id == revoked.id).values(is_active=False))
+                await writer.commit()
+            graph.apply_rule(granted)
+            graph.remove_rule(revoked.id)
+
+            session.resume.set()
+            await rebuild
+
+        assert graph.check(0, 3, 4) == (True, "Permanent rule exists")
+        assert graph.check(0, 1, 2) == (False, "No communication rule found between departments")
+
+    asyncio.run(scenario())
+
+
+def test_rule_revoked_through_another_worker_is_not_honoured(organisation):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            rule = models.CommunicationRule(dept_a_id=1, dept_b_id=2, rule_type="permanent", approved_by_id=1)
+            db.add(rule)
+            await db.commit()
+            # This process's graph stands in for worker A, other_worker for worker B
+            other_worker = PermissionGraph(max_age_seconds=3600)
+            await other_worker.ensure_loaded(db)
+            await permission_graph.ensure_loaded(db)
+        assert other_worker.check(0, 1, 2) == (True, "Permanent rule exists")
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post("/api/auth/login", data={"username": "admin@example.com", "password": PASSWORD})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            response = await client.delete(f"/api/communication-rules/{rule.id}", headers=headers)
+            assert response.status_code == 204
+
+        loaded_at = permission_graph._loaded_at
+        async with AsyncSessionLocal() as db:
+            await other_worker.ensure_loaded(db)
+            # The writer patched its own graph up to the new version: no rebuild
+            await permission_graph.ensure_loaded(db)
+        assert other_worker.check(0, 1, 2) == (False, "No communication rule found between departments")
+        assert permission_graph.check(0, 1, 2) == (False, "No communication rule found between departments")
+        assert permission_graph._loaded_at == loaded_at
+
+    asyncio.run(scenario())
+
+
+class ThreadRecordingGraph(PermissionGraph):
+    load_threads = []
+
+    def _load(self, users, rules):
+        self.load_threads.append(threading.get_ident())
+        super()._load(users, rules)
+
+
+def test_rebuild_compiles_off_the_event_loop(organisation):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            db.add(models.CommunicationRule(dept_a_id=1, dept_b_id=2, rule_type="permanent", approved_by_id=1))
+            await db.commit()
+
+        graph = ThreadRecordingGraph(max_age_seconds=0)
+        async with AsyncSessionLocal() as db:
+            await graph.ensure_loaded(db)
+            assert graph.check(0, 1, 2) == (True, "Permanent rule exists")
+
+            # Past max_age_seconds, with no write since: keep answering, refresh in the background
+            async with AsyncSessionLocal() as writer:
+                writer.add(models.CommunicationRule(dept_a_id=3, dept_b_id=4, rule_type="permanent", approved_by_id=1))
+                await writer.commit()
+            await graph.ensure_loaded(db)
+            assert graph.check(0, 3, 4) == (False, "No communication rule found between departments")
+            await graph._refresh
+        assert graph.check(0, 3, 4) == (True, "Permanent rule exists")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(ThreadRecordingGraph.load_threads) == 2
+    assert loop_thread not in ThreadRecordingGraph.load_threads
@@ -0,0 +1,111 @@
+"""
+Inbox pub/sub: a bulk send publishes in one batch, and the PostgreSQL
+backend reconnects its LISTEN connection after losing it.
+"""
+import asyncio
+import json
+import httpx
+from app import models, pubsub as pubsub_module
+from app.database import AsyncSessionLocal
+from app.main import app
+from app.pubsub import PostgresBackend, PubSub, inbox_channel, pubsub
+from conftest import PASSWORD
+
+
+def test_bulk_send_publishes_one_batch(organisation, monkeypatch):
+    receivers = [organisation[name][0] for name in ("user1b", "user2a", "user2b")]
+    batches = []
+    publish_many = pubsub.backend.publish_many
+
+    async def recording_publish_many(events):
+        batches.append([channel for channel, _ in events])
+        await publish_many(events)
+
+    monkeypatch.setattr(pubsub.backend, "publish_many", recording_publish_many)
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            db.add(models.CommunicationRule(dept_a_id=1, dept_b_id=2, rule_type="permanent", approved_by_id=1))
+            await db.commit()
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post("/api/auth/login", data={"username": "user1a@example.com", "password": PASSWORD})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            async with pubsub.subscribe(inbox_channel(receivers[0])) as first, \
+                    pubsub.subscribe(inbox_channel(receivers[2])) as last:
+                response = await client.post("/api/messages/send-bulk", headers=headers, json={
+                    "receiver_ids": receivers, "subject": "Hello", "message_content": "Hi"
+                })
+                assert response.status_code == 201
+                assert response.json()["sent_count"] == 3
+                return first.queue.get_nowait(), last.queue.get_nowait()
+
+    first_event, last_event = asyncio.run(scenario())
+    assert batches == [[inbox_channel(receiver_id) for receiver_id in receivers]]
+    assert first_event["data"]["receiver_id"] == receivers[0]
+    assert last_event["data"]["receiver_id"] == receivers[2]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.listeners = {}
+        self.termination_listeners = []
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        for callback in self.termination_listeners:
+            callback(self)
+
+    def notify(self, channel, payload):
+        self.listeners[channel](self, 1, channel, payload)
+
+
+def test_listen_connection_reconnects_and_ends_streams(monkeypatch):
+    connections = []
+    failures = [OSError("connection refused"), OSError("connection refused")]
+
+    async def connect(dsn):
+        if connections and failures:
+            raise failures.pop(0)
+        connection = FakeConnection()
+        connections.append(connection)
+        return connection
+
+    monkeypatch.setattr(pubsub_module.asyncpg, "connect", connect)
+
+    async def scenario():
+        backend = PostgresBackend("postgresql://test", reconnect_base_seconds=0.01, reconnect_max_seconds=0.02)
+        local = PubSub(backend, queue_size=10)
+        await local.start()
+        try:
+            async with local.subscribe(inbox_channel(1)) as subscription:
+                connections[0].terminate()
+                while len(connections) < 2 or local.subscriber_count():
+                    await asyncio.sleep(0.01)
+                # Streams that may have missed events are ended
+                assert subscription.overflowed
+
+            async with local.subscribe(inbox_channel(1)) as subscription:
+                event = {"id": 7, "type": "message", "data": {}}
+                connections[1].notify(
+                    backend.notify_channel, json.dumps({"channel": inbox_channel(1), "event": event})
+                )
+                assert subscription.queue.get_nowait() == event
+        finally:
+            await local.stop()
+        return backend
+
+    backend = asyncio.run(scenario())
+    assert failures == []
+    assert [connection.closed for connection in connections] == [False, True]
+    assert backend._listener is None
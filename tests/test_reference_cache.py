@@ -0,0 +1,31 @@
+"""
+Reference data answers a matching If-None-Match with 304, but only for
+departments and roles that exist.
+"""
+import asyncio
+import httpx
+from app.main import app
+from conftest import PASSWORD
+
+
+def test_conditional_get_of_missing_entity_is_not_found(organisation):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post("/api/auth/login", data={"username": "user1a@example.com", "password": PASSWORD})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            statuses = {}
+            for path in ("/api/departments", "/api/roles"):
+                listed = await client.get(f"{path}/", headers=headers)
+                conditional = {**headers, "If-None-Match": listed.headers["ETag"]}
+                statuses[path] = (
+                    (await client.get(f"{path}/1", headers=conditional)).status_code,
+                    (await client.get(f"{path}/999", headers=conditional)).status_code,
+                    (await client.get(f"{path}/999", headers={**headers, "If-None-Match": "*"})).status_code,
+                )
+        return statuses
+
+    assert asyncio.run(scenario()) == {
+        "/api/departments": (304, 404, 404),
+        "/api/roles": (304, 404, 404),
+    }
@@ -0,0 +1,42 @@
+"""
+The inbox stream takes a single-purpose ticket in its URL, never an access
+token, and a ticket is good for nothing but the stream.
+"""
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from app.auth import STREAM_TICKET_PURPOSE, get_user_from_token
+from app.database import AsyncSessionLocal
+from app.main import app
+from conftest import PASSWORD
+
+
+def test_stream_ticket_only_opens_the_stream(organisation):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post(
+                "/api/auth/login", data={"username": "user1a@example.com", "password": PASSWORD}
+            )
+            access_token = login.json()["access_token"]
+            response = await client.post(
+                "/api/messages/stream-ticket", headers={"Authorization": f"Bearer {access_token}"}
+            )
+            assert response.status_code == 200
+            ticket = response.json()["ticket"]
+
+            # The ticket is no access token
+            me = await client.get("/api/auth/me", headers={"Authorization": f"Bearer {ticket}"})
+            assert me.status_code == 401
+            # and an access token is no ticket
+            stream = await client.get("/api/messages/stream", params={"ticket": access_token})
+            assert stream.status_code == 401
+
+        async with AsyncSessionLocal() as db:
+            user = await get_user_from_token(ticket, db, purpose=STREAM_TICKET_PURPOSE)
+            assert user.email == "user1a@example.com"
+            with pytest.raises(HTTPException):
+                await get_user_from_token(access_token, db, purpose=STREAM_TICKET_PURPOSE)
+
+    asyncio.run(scenario())